@@ -1,12 +1,34 @@
 import logging
-from flask import Flask, send_file, make_response, request, jsonify
+from flask import Flask, Response, g, send_file, make_response, request, jsonify
 from flask_cors import CORS
-from datetime import datetime
-from supervised.gen import generate_music
-from reinforcement.utils import save_genome_to_midi
+from supervised.gen import GENRES, generate_music, load_genre
+from supervised.registry import ModelRegistry
+from supervised.sampler import MicroBatcher
+from supervised.pregen import PregenPool
+from reinforcement.utils import render_genome_to_midi, save_genome_to_midi
 from reinforcement.genetic_algorithm import fitness_automated, run_evolution
-from pyo import *
+from reinforcement.parallel import init_worker
+from reinforcement.vectorized import fitness_population
+from reinforcement.cache import FitnessCache, LRUCache, genome_key
+from reinforcement.selection import DEFAULT_SELECTION, SELECTION_STRATEGIES
+from reinforcement.jobs import FAILED, QUEUED, RUNNING, JobManager, JobQueueFull
+from reinforcement.store import RunStore
+from reinforcement.ratings import DEFAULT_RATING_TIMEOUT, RatingSessions
+from reinforcement.convergence import CONVERGED, DEFAULT_PATIENCE, MAX_GENERATIONS, PLATEAU, ConvergenceMonitor
+from metrics import CONTENT_TYPE, RequestProfiler, metrics
+from engines import Preloader, loaded_engines
+import hashlib
+import itertools
+import io
+import json
+import multiprocessing
 import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
 os.environ['PYTHONUNBUFFERED'] = '1'
 
@@ -16,166 +38,623 @@ CORS(app)
 DEFAULT_NUM_MUTATIONS = 2
 DEFAULT_MUTATION_PROBABILITY = 0.5
 DEFAULT_BPM = 120
+DEFAULT_NUMBER_OF_GENERATIONS = 10
 BITS_PER_NOTE = 4
+MELODY_PARAMS = ('bars', 'num_notes', 'num_steps', 'pauses', 'key', 'scale', 'root')
+MODEL_REGISTRY_MAX_MODELS = int(os.environ.get('MODEL_REGISTRY_MAX_MODELS', len(GENRES)))
+MODEL_REGISTRY_MAX_BYTES = int(os.environ.get('MODEL_REGISTRY_MAX_BYTES', 0)) or None
+SAMPLER_MAX_BATCH_SIZE = int(os.environ.get('SAMPLER_MAX_BATCH_SIZE', 8))
+SAMPLER_MAX_WAIT = float(os.environ.get('SAMPLER_MAX_WAIT', 0.02))
+# carrying the LSTM state is a different sampler from the windowed one, so it stays off by default;
+# INCREMENTAL_REPRIME_EVERY=k re-primes on the last window every k notes to keep the context bounded
+INCREMENTAL_INFERENCE = os.environ.get('INCREMENTAL_INFERENCE', '0') == '1'
+INCREMENTAL_REPRIME_EVERY = int(os.environ.get('INCREMENTAL_REPRIME_EVERY', 0)) or None
+# 'numpy' serves the models exported by supervised/numpy_lstm.py without importing Keras
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'keras')
+NUMPY_DEQUANTIZE = os.environ.get('NUMPY_DEQUANTIZE', '0') == '1'
+# next to the backend rather than the working directory the API was started from
+RUNS_FOLDER = os.environ.get('RUNS_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runs'))
+RUN_STORE_PATH = os.environ.get('RUN_STORE_PATH', f'{RUNS_FOLDER}/runs.sqlite3')
+# a fork keeps the genome layout of its parent, so only these may change
+FORK_PARAMS = ('number_of_generations', 'selection', 'fitness_choice', 'save_to_disk', 'patience')
+JOB_MAX_WORKERS = int(os.environ.get('JOB_MAX_WORKERS', 2))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
+LONG_POLL_TIMEOUT = float(os.environ.get('LONG_POLL_TIMEOUT', 30))
+# how long a rating-mode generation waits for its ratings before unrated genomes score 0
+RATING_TIMEOUT = float(os.environ.get('RATING_TIMEOUT', DEFAULT_RATING_TIMEOUT))
+FITNESS_CACHE_SIZE = int(os.environ.get('FITNESS_CACHE_SIZE', 100000))
+GA_PROCESSES = int(os.environ.get('GA_PROCESSES', 0))
+GA_CHUNK_SIZE = int(os.environ.get('GA_CHUNK_SIZE', 64))
+MIDI_CACHE_SIZE = int(os.environ.get('MIDI_CACHE_SIZE', 2048))
+MIDI_MAX_AGE = int(os.environ.get('MIDI_MAX_AGE', 3600))
+WARM_UP_GENRES = [genre for genre in os.environ.get('WARM_UP_GENRES', '').split(',') if genre]
+PREGEN_GENRES = [genre for genre in os.environ.get('PREGEN_GENRES', ','.join(GENRES)).split(',') if genre]
+PREGEN_DEPTH = int(os.environ.get('PREGEN_DEPTH', 0))
+PREGEN_REFILL_INTERVAL = float(os.environ.get('PREGEN_REFILL_INTERVAL', 0.5))
+PRELOAD_ENGINES = [engine for engine in os.environ.get('PRELOAD_ENGINES', '').split(',') if engine]
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING').upper()
+PROFILE_DIR = os.environ.get('PROFILE_DIR')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+
+logging.basicConfig(level=LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+model_registry = ModelRegistry(loader=partial(load_genre, incremental=INCREMENTAL_INFERENCE, backend=MODEL_BACKEND,
+                                              dequantize=NUMPY_DEQUANTIZE),
+                               max_models=MODEL_REGISTRY_MAX_MODELS, max_bytes=MODEL_REGISTRY_MAX_BYTES)
+sampler = MicroBatcher(model_registry, max_batch_size=SAMPLER_MAX_BATCH_SIZE, max_wait=SAMPLER_MAX_WAIT,
+                       incremental=INCREMENTAL_INFERENCE, reprime_every=INCREMENTAL_REPRIME_EVERY)
+pregen_genres = [genre for genre in PREGEN_GENRES if genre in GENRES]
+# when the registry cannot keep every pre-generated genre loaded, only the genres requests already loaded are
+# refilled, so the refills do not cycle models in and out of the registry
+pregen_pool = PregenPool(partial(generate_music, registry=model_registry, batcher=sampler), pregen_genres,
+                         depth=PREGEN_DEPTH, refill_interval=PREGEN_REFILL_INTERVAL,
+                         loaded=None if model_registry.can_hold(len(pregen_genres)) else model_registry.loaded)
+fitness_cache = FitnessCache(max_entries=FITNESS_CACHE_SIZE)
+midi_cache = LRUCache(max_entries=MIDI_CACHE_SIZE)
+ga_executor = None
+ga_executor_lock = threading.Lock()
+run_store = RunStore(RUN_STORE_PATH)
+rating_sessions = RatingSessions()
+
+
+def get_ga_executor():
+    # started on the first automated run; spawned rather than forked, since this process already runs threads
+    global ga_executor
+    with ga_executor_lock:
+        if ga_executor is None and GA_PROCESSES > 0:
+            ga_executor = ProcessPoolExecutor(max_workers=GA_PROCESSES, mp_context=multiprocessing.get_context('spawn'),
+                                              initializer=init_worker, initargs=(LOG_LEVEL,))
+        return ga_executor
+
+
+def start_run(job):
+    run_store.set_status(job.id, RUNNING)
+
+
+def finish_run(job):
+    run_store.set_status(job.id, job.status, job.error, job.stop_reason)
+    rating_sessions.close(job.id)
+
+
+job_manager = JobManager(max_workers=JOB_MAX_WORKERS, result_ttl=JOB_RESULT_TTL, on_start=start_run,
+                         on_finish=finish_run)
+preloader = Preloader(engines=PRELOAD_ENGINES, genres=WARM_UP_GENRES, registry=model_registry)
+profiler = RequestProfiler(PROFILE_DIR) if PROFILE_DIR else None
+services_started = False
+services_lock = threading.Lock()
+
+
+def start_services():
+    # Background threads start here rather than at import: the GA's spawned workers import the main module
+    # again, as __mp_main__ when the API is run as a script, and must not preload engines, pre-generate
+    # melodies or clean up jobs of their own.
+    global services_started
+    with services_lock:
+        if not services_started:
+            preloader.start()
+            pregen_pool.start()
+            job_manager.start()
+            services_started = True
+
+
+def collect_gauges():
+    for name, cache in (('fitness', fitness_cache), ('midi', midi_cache)):
+        stats = cache.stats()
+        yield 'cache_entries', {'cache': name}, stats['entries']
+        yield 'cache_hits_total', {'cache': name}, stats['hits']
+        yield 'cache_misses_total', {'cache': name}, stats['misses']
+    yield 'registry_loaded_models', {}, len(model_registry.loaded())
+    yield 'registry_bytes', {}, model_registry.total_bytes()
+    for genre, stats in pregen_pool.stats().items():
+        yield 'pregen_buffered', {'genre': genre}, stats['buffered']
+        yield 'pregen_hit_ratio', {'genre': genre}, stats['hit_ratio']
+
+
+metrics.add_collector(collect_gauges)
+
+
+@app.before_request
+def start_request_timer():
+    # WSGI servers import the module without running it as a script, so the first request starts the services
+    start_services()
+    g.request_start = time.perf_counter()
+    g.profile = None
+    # profiling is opt-in: PROFILE_DIR enables it for ?profile=1 and a PROFILE_SAMPLE_RATE fraction of requests
+    if profiler is not None and (request.args.get('profile') == '1' or random.random() < PROFILE_SAMPLE_RATE):
+        g.profile = profiler.start()
+
+
+@app.after_request
+def record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    if g.get('profile') is not None:
+        file_path = profiler.stop(g.pop('profile'), request.endpoint or 'unmatched')
+        response.headers['X-Profile'] = os.path.basename(file_path)
+    if 'request_start' in g:
+        metrics.observe('request_seconds', time.perf_counter() - g.request_start, endpoint=endpoint,
+                        method=request.method)
+    metrics.inc('requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def stop_profile(exception=None):
+    # after_request does not run if the response could not be built
+    if g.get('profile') is not None:
+        profiler.stop(g.pop('profile'), request.endpoint or 'unmatched')
+
+
+@app.route('/ready', methods=['GET'])
+def get_ready():
+    # 503 until the configured preloads finished, so a load balancer only routes to warm workers
+    body = {
+        'ready': preloader.ready,
+        'engines': loaded_engines(),
+        'models': model_registry.loaded(),
+        'preload': preloader.status(),
+        'pregen': pregen_pool.stats(),
+    }
+    return jsonify(body), 200 if preloader.ready else 503
 
-ratings = {}
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
 
 
 @app.route('/get_midi_file', methods=['GET'])
 def send_midi():
     genre = request.args.get('genre')
-    file_path, key_signature = generate_music(genre)
-    if file_path:
-        with open(file_path, 'rb') as f:
-            midi_content = f.read()
-        response = make_response(send_file(file_path, as_attachment=True, mimetype='audio/midi'))
+    if genre not in GENRES:
+        return f"Unknown genre: {genre}", 400
+    midi_bytes, key_signature = pregen_pool.take(genre)
+    if midi_bytes:
+        response = make_response(send_file(io.BytesIO(midi_bytes), as_attachment=True, mimetype='audio/midi',
+                                           download_name=f'{genre}.mid'))
         response.headers['key-signature'] = key_signature
         return response
     else:
         return "Failed to generate MIDI file", 500
 
 
+def send_midi_bytes(midi_bytes, download_name, etag, immutable=False):
+    response = make_response(send_file(io.BytesIO(midi_bytes), as_attachment=True, mimetype='audio/midi',
+                                       download_name=download_name, etag=etag, max_age=MIDI_MAX_AGE))
+    # only a URL naming its job serves the same bytes forever; otherwise the browser revalidates the ETag
+    if immutable:
+        response.headers['Cache-Control'] = f'private, max-age={MIDI_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def stored_result(run_id, population_index):
+    checkpoint = run_store.load_generation(run_id, population_index)
+    if checkpoint is None:
+        return None
+    population = checkpoint['population']
+    return {'sorted_population': list(zip(population, checkpoint['scores'])),
+            'best_genome': population[checkpoint['best_index']]}
+
+
+def parse_index(value):
+    # None when the index is missing or not an integer, so the route can answer 400
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def send_run_genome(job_id, population_index, genome_index=None):
+    job = job_manager.get(job_id)
+    if job is None:
+        # not running in this process: serve the checkpoint from the run store
+        run = run_store.get_run(job_id)
+        if run is None:
+            return "Unknown job", 404
+        params = run['params']
+        result = stored_result(run['id'], population_index)
+    else:
+        params = job.params
+        result = job.results.get(population_index)
+        # resumed and forked jobs only hold the generations they evolved themselves
+        if result is None:
+            result = stored_result(job.id, population_index)
+        # long-poll: the run is asynchronous, so wait for the requested generation to be saved
+        if result is None and not job.wait_for_progress(population_index - job.start_generation + 1,
+                                                        LONG_POLL_TIMEOUT):
+            if job.status == FAILED:
+                return f"Evolution failed: {job.error}", 500
+            return "Generation not ready", 404
+        if result is None:
+            result = job.results.get(population_index)
+
+    if result is None:
+        return "Generation not found", 404
+    if genome_index is None:
+        genome = result['best_genome']
+        download_name = "best.mid"
+    else:
+        if not 0 <= genome_index < len(result['sorted_population']):
+            return "Genome not found", 404
+        genome = result['sorted_population'][genome_index][0]
+        download_name = f"{params['scale']}-{params['key']}-{genome_index}.mid"
+
+    melody_args = tuple(params[name] for name in MELODY_PARAMS)
+    cache_key = (genome_key(genome), melody_args, DEFAULT_BPM)
+    found, entry = midi_cache.get(cache_key)
+    if not found:
+        midi_bytes = render_genome_to_midi(genome, *melody_args, DEFAULT_BPM, cache=fitness_cache)
+        entry = (midi_bytes, hashlib.sha1(midi_bytes).hexdigest())
+        midi_cache.put(cache_key, entry)
+    midi_bytes, etag = entry
+    # an unrated generation is re-sorted once its ratings are in, so its genome indices still change
+    return send_midi_bytes(midi_bytes, download_name, etag, immutable=not result.get('awaiting_ratings'))
+
+
 @app.route('/get_genome', methods=['GET'])
 def send_genome():
-    scale = request.args.get('scale')
-    key = request.args.get('key')
-    genome_index = request.args.get('genome_index')
-    population_index = request.args.get('generation_index')
-
-    file_path = f"{folder}/{population_index}/{scale}-{key}-{genome_index}.mid"
-    print(file_path)
-    if file_path:
-        with open(file_path, 'rb') as f:
-            midi_content = f.read()
-        response = make_response(send_file(file_path, as_attachment=True, mimetype='audio/midi'))
-        return response
-    else:
-        return "Failed to generate MIDI file", 500
+    job_id = request.args.get('job_id')
+    genome_index = parse_index(request.args.get('genome_index'))
+    population_index = parse_index(request.args.get('generation_index'))
+    if not job_id or population_index is None or genome_index is None:
+        return "job_id, generation_index and genome_index are required", 400
+    return send_run_genome(job_id, population_index, genome_index)
 
 
 @app.route('/get_best_genome', methods=['GET'])
 def send_best_genome():
-    population_index = request.args.get('generation_index')
-    file_path = f"{folder}/{population_index}/best.mid"
-    print(file_path)
-    if file_path:
-        with open(file_path, 'rb') as f:
-            midi_content = f.read()
-        response = make_response(send_file(file_path, as_attachment=True, mimetype='audio/midi'))
-        return response
-    else:
-        return "Failed to generate MIDI file", 500
-
+    job_id = request.args.get('job_id')
+    population_index = parse_index(request.args.get('generation_index'))
+    if not job_id or population_index is None:
+        return "job_id and generation_index are required", 400
+    return send_run_genome(job_id, population_index)
+
+
+def evolve(job, checkpoint=None):
+    params = job.params
+    bars = params['bars']
+    num_notes = params['num_notes']
+    num_steps = params['num_steps']
+    pauses = params['pauses']
+    key = params['key']
+    scale = params['scale']
+    root = params['root']
+    number_of_generations = params['number_of_generations']
+    folder = job.folder if params['save_to_disk'] else None
 
-@app.route('/generate_custom_melody', methods=['POST'])
-def generate_custom_melody():
-    data = request.json
-    bars = int(data.get('bars', 8))
-    num_notes = int(data.get('num_notes', 4))
-    num_steps = int(data.get('num_steps', 1))
-    pauses = data.get('pauses', True)
-    key = data.get('key', 'C')
-    scale = data.get('scale', 'major')
-    root = int(data.get('root', 4))
-    population_size = int(data.get('population_size', 4))
-    number_of_generations = data.get('number_of_generations')
-    print("population size:", population_size)
-    fitness_choice = data.get('fitness_choice')
-    print(fitness_choice)
-
-    global folder
     num_mutations = DEFAULT_NUM_MUTATIONS
     mutation_probability = DEFAULT_MUTATION_PROBABILITY
     bpm = DEFAULT_BPM
-    fitness_func = fitness_automated if fitness_choice == 'Automated' else fitness_rating_mode
-
-    best_genome = None
-    best_fitness = float('-inf')
-    previous_best_genome = None
+    automated = params['fitness_choice'] == 'Automated'
+    fitness_func = fitness_automated if automated else None
+    if automated:
+        batch_fitness_func = fitness_population
+    else:
+        batch_fitness_func = partial(rate_population, job, rating_sessions.open(job.id),
+                                     itertools.count(job.start_generation))
+    # ratings are not reproducible, so only automated scores are memoized
+    cache = fitness_cache if automated else None
+    # rating mode reads this process's ratings, so it cannot be scored in worker processes
+    executor = get_ga_executor() if automated else None
+
+    # runs created before early stopping have no patience and evolve as they always did
+    monitor = ConvergenceMonitor(params['patience']) if params.get('patience') is not None else None
+
+    # every generation is checkpointed with the generator state, so a checkpoint resumes the run exactly
+    rng = random.Random(params['seed'])
+    population = None
     previous_best_fitness = None
-    folder = str(int(datetime.now().timestamp()))
-    os.makedirs(folder, exist_ok=True)
+    if checkpoint is not None:
+        rng.setstate(checkpoint['rng_state'])
+        population = checkpoint['next_population']
+        previous_best_fitness = checkpoint['best_fitness']
+        if monitor is not None:
+            replay_monitor(monitor, job.id, checkpoint['generation'])
+    if folder:
+        os.makedirs(folder, exist_ok=True)
     genome_length = bars * num_notes * BITS_PER_NOTE
-    s = Server().boot()
-
-    generation_index = 0
 
     for population_id, population, next_generation, population_fitness in run_evolution(
-            population_size, genome_length, fitness_func, num_mutations, mutation_probability,
-            bars, num_notes, num_steps, pauses, key, scale, root
+            params['population_size'], genome_length, fitness_func, num_mutations, mutation_probability,
+            bars, num_notes, num_steps, pauses, key, scale, root, batch_fitness_func=batch_fitness_func,
+            cache=cache, executor=executor, chunk_size=GA_CHUNK_SIZE, selection=params['selection'], rng=rng,
+            population=population, start_generation=job.start_generation, monitor=monitor
     ):
-        print(f"Population {population_id} done")
+        job.check_cancelled()
+        logger.info("Population %s done", population_id)
 
-        print("Saving results...")
         sorted_population = sorted(population_fitness, key=lambda x: x[1], reverse=True)
-        for i, (genome, fitness) in enumerate(sorted_population):
-            save_genome_to_midi(f"{folder}/{population_id}/{scale}-{key}-{i}.mid", genome, bars, num_notes,
-                                num_steps,
-                                pauses, key, scale, root, bpm)
-
-        new_best_genome = None
-        new_best_fitness = float('-inf')
-        for genome, fitness in sorted_population:
-            if fitness != previous_best_fitness:
-                new_best_genome = genome
-                new_best_fitness = fitness
-                break
-
-        if new_best_genome is None:
-            if len(sorted_population) > 1:
-                new_best_genome = sorted_population[1][0]
-                new_best_fitness = sorted_population[1][1]
-            else:
-                new_best_genome = sorted_population[0][0]
-                new_best_fitness = sorted_population[0][1]
-
-        best_genome = new_best_genome
-        best_fitness = new_best_fitness
-        previous_best_genome = best_genome
+        if folder:
+            logger.debug("Saving results to %s", folder)
+            with metrics.stage('save'):
+                for i, (genome, fitness) in enumerate(sorted_population):
+                    save_genome_to_midi(f"{folder}/{population_id}/{scale}-{key}-{i}.mid", genome, bars, num_notes,
+                                        num_steps,
+                                        pauses, key, scale, root, bpm, cache=fitness_cache)
+
+        best_index = next((i for i, (genome, fitness) in enumerate(sorted_population)
+                           if fitness != previous_best_fitness), None)
+        if best_index is None:
+            best_index = 1 if len(sorted_population) > 1 else 0
+        best_genome, best_fitness = sorted_population[best_index]
         previous_best_fitness = best_fitness
 
-        if best_genome is not None:
-            save_genome_to_midi(f"{folder}/{population_id}/best.mid", best_genome, bars, num_notes,
-                                num_steps, pauses, key, scale,
-                                root, bpm)
-        print("Done!")
+        with metrics.stage('checkpoint'):
+            run_store.save_generation(job.id, population_id, population, [fitness for _, fitness in sorted_population],
+                                      next_generation, rng.getstate(), best_index, best_fitness)
+
+        if folder:
+            with metrics.stage('save'):
+                save_genome_to_midi(f"{folder}/{population_id}/best.mid", best_genome, bars, num_notes,
+                                    num_steps, pauses, key, scale,
+                                    root, bpm, cache=fitness_cache)
+        job.results[population_id] = {'sorted_population': sorted_population, 'best_genome': best_genome}
+        job.publish(dict({'generation_index': population_id, 'best_fitness': best_fitness,
+                          'population_size': len(sorted_population)}, **(monitor.last if monitor else {})))
+
+        if population_id >= number_of_generations:
+            break
+
+    job.stop_reason = monitor.stop_reason if monitor is not None and monitor.stop_reason else MAX_GENERATIONS
+    metrics.inc('ga_runs_stopped_total', reason=job.stop_reason)
+
+
+def replay_monitor(monitor, run_id, generation):
+    # the monitor's state is a function of the checkpoints, so replaying them keeps a resumed run identical
+    # to one that was never interrupted
+    for summary in run_store.generation_summaries(run_id):
+        if summary['generation'] > generation:
+            break
+        checkpoint = run_store.load_generation(run_id, summary['generation'])
+        monitor.update(checkpoint['population'], checkpoint['scores'])
+
+
+@app.route('/generate_custom_melody', methods=['POST'])
+def generate_custom_melody():
+    data = request.json
+    params = {
+        'bars': int(data.get('bars', 8)),
+        'num_notes': int(data.get('num_notes', 4)),
+        'num_steps': int(data.get('num_steps', 1)),
+        'pauses': data.get('pauses', True),
+        'key': data.get('key', 'C'),
+        'scale': data.get('scale', 'major'),
+        'root': int(data.get('root', 4)),
+        'population_size': int(data.get('population_size', 4)),
+        'number_of_generations': int(data.get('number_of_generations', DEFAULT_NUMBER_OF_GENERATIONS)),
+        'fitness_choice': data.get('fitness_choice'),
+        'seed': data.get('seed'),
+        'selection': data.get('selection', DEFAULT_SELECTION),
+        'save_to_disk': bool(data.get('save_to_disk', False)),
+        # generations without a better best fitness before the run stops early; 0 never stops early
+        'patience': int(data.get('patience', DEFAULT_PATIENCE)),
+    }
+    if params['selection'] not in SELECTION_STRATEGIES:
+        return jsonify({'error': f"Unknown selection strategy: {params['selection']}"}), 400
+    logger.info("Evolving a population of %s with %s fitness", params['population_size'], params['fitness_choice'])
+
+    run_id = uuid.uuid4().hex
+    run_store.create_run(run_id, params, QUEUED)
+    try:
+        job = job_manager.submit(evolve, params, run_folder(run_id), job_id=run_id, own_thread=awaits_ratings(params))
+    except JobQueueFull as e:
+        return reject_run(run_id, e)
+    return jsonify({'success': True, 'job_id': job.id}), 202
+
+
+def awaits_ratings(params):
+    # a rating run waits up to RATING_TIMEOUT per generation, which would tie up an evolution worker
+    return params['fitness_choice'] != 'Automated'
+
+
+def reject_run(run_id, error):
+    run_store.set_status(run_id, FAILED, str(error))
+    return jsonify({'error': f"Too many evolutions, try again later: {error}"}), 503
+
+
+def run_folder(run_id):
+    return os.path.abspath(f"{RUNS_FOLDER}/{run_id}")
 
-        if generation_index >= number_of_generations:
-            return jsonify({'success': True})
-        else:
-            generation_index += 1
+
+def submit_from_checkpoint(run_id, params, checkpoint):
+    start_generation = checkpoint['generation'] + 1 if checkpoint is not None else 0
+    try:
+        job = job_manager.submit(partial(evolve, checkpoint=checkpoint), params, run_folder(run_id), job_id=run_id,
+                                 start_generation=start_generation, own_thread=awaits_ratings(params))
+    except JobQueueFull as e:
+        return reject_run(run_id, e)
+    return jsonify({'success': True, 'job_id': job.id, 'start_generation': start_generation}), 202
+
+
+@app.route('/runs', methods=['GET'])
+def list_runs():
+    return jsonify(run_store.list_runs(int(request.args.get('limit', 50))))
+
+
+@app.route('/runs/<run_id>', methods=['GET'])
+def get_run(run_id):
+    run = run_store.get_run(run_id)
+    if run is None:
+        return jsonify({'error': 'Unknown run'}), 404
+    run['generation_summaries'] = run_store.generation_summaries(run_id)
+    return jsonify(run)
+
+
+@app.route('/runs/<run_id>/resume', methods=['POST'])
+def resume_run(run_id):
+    run = run_store.get_run(run_id)
+    if run is None:
+        return jsonify({'error': 'Unknown run'}), 404
+    active = job_manager.get(run_id)
+    if active is not None and not active.finished:
+        return jsonify({'error': 'Run is still active'}), 409
+
+    params = run['params']
+    data = request.get_json(silent=True) or {}
+    if 'number_of_generations' in data:
+        params['number_of_generations'] = int(data['number_of_generations'])
+    if 'patience' in data:
+        params['patience'] = int(data['patience'])
+    elif run['stop_reason'] in (PLATEAU, CONVERGED):
+        return jsonify({'error': f"Run stopped early ({run['stop_reason']}), raise its patience to continue"}), 400
+    checkpoint = run_store.load_generation(run_id)
+    if checkpoint is not None and checkpoint['generation'] >= params['number_of_generations']:
+        return jsonify({'error': 'Run already reached its last generation'}), 400
+    run_store.update_run(run_id, params, QUEUED)
+    return submit_from_checkpoint(run_id, params, checkpoint)
+
+
+@app.route('/runs/<run_id>/fork', methods=['POST'])
+def fork_run(run_id):
+    run = run_store.get_run(run_id)
+    if run is None:
+        return jsonify({'error': 'Unknown run'}), 404
+    data = request.get_json(silent=True) or {}
+    generation = data.get('generation')
+    checkpoint = run_store.load_generation(run_id, None if generation is None else int(generation))
+    if checkpoint is None:
+        return jsonify({'error': 'Generation not found'}), 404
+
+    params = dict(run['params'], **{name: data[name] for name in FORK_PARAMS if name in data})
+    params['number_of_generations'] = int(params['number_of_generations'])
+    params['save_to_disk'] = bool(params['save_to_disk'])
+    if params.get('patience') is not None:
+        params['patience'] = int(params['patience'])
+    if params['selection'] not in SELECTION_STRATEGIES:
+        return jsonify({'error': f"Unknown selection strategy: {params['selection']}"}), 400
+    if checkpoint['generation'] >= params['number_of_generations']:
+        return jsonify({'error': 'Fork point is past the last generation'}), 400
+
+    fork_id = uuid.uuid4().hex
+    run_store.create_run(fork_id, params, QUEUED, parent_id=run_id, parent_generation=checkpoint['generation'])
+    return submit_from_checkpoint(fork_id, params, checkpoint)
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    # optional long-poll until `generations` generations are done
+    generations = request.args.get('generations')
+    if generations is not None:
+        timeout = min(float(request.args.get('timeout', LONG_POLL_TIMEOUT)), LONG_POLL_TIMEOUT)
+        job.wait_for_progress(int(generations), timeout)
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    start = int(request.args.get('start', 0))
+
+    def stream():
+        for event in job.events(start, timeout=LONG_POLL_TIMEOUT):
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: generation\ndata: {json.dumps(event)}\n\n"
+        yield f"event: end\ndata: {json.dumps({'status': job.status, 'error': job.error})}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify({'success': True, 'status': job.status})
+
+
+@app.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(fitness_cache.stats())
+
+
+def rate_population(job, session, generations, genomes, *melody_args):
+    # rating mode: publish the unscored generation so its genomes can be listened to and rated by index,
+    # then wait until every genome is rated or RATING_TIMEOUT passes
+    generation = next(generations)
+    job.results[generation] = {'sorted_population': [(genome, None) for genome in genomes],
+                               'best_genome': genomes[0], 'awaiting_ratings': True}
+    session.expect(generation, len(genomes))
+    # ratings saved before the run was interrupted count for the resumed run
+    session.put_many(run_store.ratings(job.id, generation), generation)
+    with metrics.stage('rating_wait'):
+        scores, missing = session.wait(generation, len(genomes), RATING_TIMEOUT, cancelled=lambda: job.cancelled)
+    job.check_cancelled()
+    if missing:
+        logger.warning("Generation %s of %s scored with %s missing ratings", generation, job.id, missing)
+        metrics.inc('ratings_missing_total', missing)
+    return scores
+
+
+def parse_ratings(data):
+    # either a single rating or a batch under 'ratings'; genomes are named by index or by their file name
+    entries = data.get('ratings', [data])
+    if not isinstance(entries, list):
+        raise ValueError("ratings must be a list")
+    ratings = {}
+    for entry in entries:
+        try:
+            genome_index = entry.get('genome_index')
+            if genome_index is None:
+                genome_index = entry['filename'].split('-')[-1].split('.')[0]
+            ratings[int(genome_index)] = int(entry['rating'])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError(f"Malformed rating: {entry!r}") from None
+    return ratings
 
 
 @app.route('/rate_melody', methods=['POST'])
 def rate_melody():
     try:
-        data = request.json
-        filename = data.get('filename')
-        rating = int(data.get('rating'))
-        print(f"Melody {filename}: Rating: {rating}")
-        ratings[filename] = rating
-        print(ratings)
-
-        return jsonify({'success': True})
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+        try:
+            ratings = parse_ratings(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        job_id = data.get('job_id')
+        if not job_id:
+            return jsonify({'error': 'job_id is required'}), 400
+        if job_manager.get(job_id) is None and run_store.get_run(job_id) is None:
+            return jsonify({'error': 'Unknown job'}), 404
+        session = rating_sessions.get(job_id)
+        generation = data.get('generation_index')
+        if generation is not None:
+            generation = parse_index(generation)
+            if generation is None:
+                return jsonify({'error': 'generation_index must be an integer'}), 400
+        elif session is not None:
+            generation = session.status()['generation']
+        logger.info("Job %s generation %s: ratings %s", job_id, generation, ratings)
+
+        # a running session only keeps ratings for generations it has not scored yet
+        accepted = session.put_many(ratings, generation) if session is not None else ratings
+        metrics.inc('ratings_total', len(ratings))
+        if generation is not None and accepted:
+            run_store.save_ratings(job_id, generation, accepted)
+        return jsonify({'success': True, 'accepted': len(accepted) if session is not None else 0})
     except Exception as e:
-        logging.error(f"Error rating melody: {e}")
+        logger.error("Error rating melody: %s", e)
         return jsonify({'error': str(e)}), 500
 
-def fitness_rating_mode(genome, bars, num_notes, num_steps, pauses, key, scale, root):
-    if ratings:
-        min_key = min(ratings.keys(), key=lambda x: int(x.split('-')[-1].split('.')[0]))
-        min_value = ratings[min_key]
-        del ratings[min_key]
-        print(f"Smallest index key found: {min_key}")
-        print(f"Corresponding value: {min_value}")
-        return min_value
-    else:
-        print("Dictionary 'ratings' is empty.")
-        return 0
-
-
 
+@app.route('/jobs/<job_id>/ratings', methods=['GET'])
+def get_job_ratings(job_id):
+    session = rating_sessions.get(job_id)
+    if session is None:
+        return jsonify({'error': 'No ratings are awaited for this job'}), 404
+    return jsonify(session.status())
 
 
 if __name__ == '__main__':
+    start_services()
     app.run(debug=True)
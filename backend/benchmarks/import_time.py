@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# packages that must stay out of the API's startup; they are imported on first use
+HEAVY_MODULES = ('keras', 'tensorflow', 'music21', 'pyo')
+
+
+def parse_importtime(stderr):
+    # lines look like "import time:       412 |       1203 |   encodings.utf_8"; the indentation of the
+    # module name is its nesting depth, so depth 0 entries add up to the whole import
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append({'module': name.strip(), 'self_us': int(self_us), 'cumulative_us': int(cumulative_us),
+                        'depth': depth})
+    return modules
+
+
+def measure_import(module):
+    with tempfile.TemporaryDirectory() as runs_folder:
+        # anything the import writes goes to a temporary runs folder, not the backend's
+        env = dict(os.environ, RUNS_FOLDER=runs_folder, RUN_STORE_PATH=os.path.join(runs_folder, 'runs.sqlite3'))
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=BACKEND, env=env,
+                                capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def heavy_imports(modules):
+    return sorted({entry['module'].split('.')[0] for entry in modules} & set(HEAVY_MODULES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that importing the API stays fast and skips the heavy stacks")
+    parser.add_argument('--module', default='api')
+    parser.add_argument('--budget', type=float, default=1.0, help="seconds the whole import may take")
+    parser.add_argument('--top', type=int, default=15, help="print the slowest modules by self time")
+    parser.add_argument('--output', help="write the per-module timings as JSON to this file")
+    args = parser.parse_args()
+
+    modules = measure_import(args.module)
+    total = sum(entry['cumulative_us'] for entry in modules if entry['depth'] == 0) / 1e6
+    heavy = heavy_imports(modules)
+
+    print(f"import {args.module}: {total:.3f}s over {len(modules)} modules (budget {args.budget:.3f}s)")
+    for entry in sorted(modules, key=lambda entry: entry['self_us'], reverse=True)[:args.top]:
+        print(f"  {entry['self_us'] / 1e3:9.1f}ms self {entry['cumulative_us'] / 1e3:9.1f}ms cumulative  "
+              f"{entry['module']}")
+    if heavy:
+        print(f"heavy modules imported at startup: {', '.join(heavy)}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'module': args.module, 'total': total, 'heavy': heavy, 'modules': modules}, f, indent=2)
+
+    sys.exit(1 if heavy or total > args.budget else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reinforcement.convergence import DEFAULT_PATIENCE, ConvergenceMonitor
+from reinforcement.genetic_algorithm import fitness_automated, generate_genome, run_evolution
+from reinforcement.utils import BITS_PER_NOTE, create_melody, render_genome_to_midi, save_genome_to_midi
+from reinforcement.vectorized import fitness_population
+
+MELODY_ARGS = {'num_notes': 4, 'num_steps': 2, 'pauses': True, 'key': 'C', 'scale': 'major', 'root': 4}
+BPM = 120
+BENCHMARKS = []
+
+
+def benchmark(group):
+    def register(func):
+        BENCHMARKS.append((group, func))
+        return func
+    return register
+
+
+def measure(func, rounds, warmup=1):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        'rounds': rounds,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'stdev': statistics.stdev(timings) if rounds > 1 else 0.0,
+    }
+
+
+def melody_args(bars):
+    return (bars, MELODY_ARGS['num_notes'], MELODY_ARGS['num_steps'], MELODY_ARGS['pauses'], MELODY_ARGS['key'],
+            MELODY_ARGS['scale'], MELODY_ARGS['root'])
+
+
+def genome_length(bars):
+    return bars * MELODY_ARGS['num_notes'] * BITS_PER_NOTE
+
+
+@benchmark('ga')
+def bench_create_melody(config):
+    for bars in config['bars']:
+        genome = generate_genome(genome_length(bars))
+        yield f'create_melody[bars={bars}]', \
+            lambda genome=genome, bars=bars: create_melody(genome, *melody_args(bars))
+
+
+@benchmark('ga')
+def bench_fitness(config):
+    for bars in config['bars']:
+        for size in config['population_sizes']:
+            population = [generate_genome(genome_length(bars)) for _ in range(size)]
+
+            def scalar(population=population, bars=bars):
+                for genome in population:
+                    fitness_automated(genome, *melody_args(bars))
+
+            yield f'fitness_automated[bars={bars},population={size}]', scalar
+            yield f'fitness_population[bars={bars},population={size}]', \
+                lambda population=population, bars=bars: fitness_population(population, *melody_args(bars))
+
+
+@benchmark('ga')
+def bench_run_evolution(config):
+    generations = config['generations']
+    for bars in config['bars']:
+        for size in config['population_sizes']:
+            def evolve(size=size, bars=bars):
+                evolution = run_evolution(size, genome_length(bars), fitness_automated, 2, 0.5, *melody_args(bars),
+                                          batch_fitness_func=fitness_population, seed=0)
+                for _ in range(generations):
+                    next(evolution)
+
+            yield f'run_evolution[bars={bars},population={size},generations={generations}]', evolve
+
+
+@benchmark('ga')
+def bench_early_stopping(config):
+    # a run as /generate_custom_melody does it with save_to_disk, up to max_generations or until the
+    # ConvergenceMonitor stops it; the ratio of each pair is the wall-clock time early stopping saves
+    max_generations = config['max_generations']
+    directory = tempfile.mkdtemp()
+    for bars in config['bars']:
+        for size in config['early_stop_population_sizes']:
+            def evolve(size=size, bars=bars, patience=None):
+                monitor = ConvergenceMonitor(patience) if patience is not None else None
+                for generation, population, _, _ in run_evolution(
+                        size, genome_length(bars), fitness_automated, 2, 0.5, *melody_args(bars),
+                        batch_fitness_func=fitness_population, seed=0, monitor=monitor):
+                    for i, genome in enumerate(population):
+                        save_genome_to_midi(os.path.join(directory, f'{i}.mid'), genome, *melody_args(bars), BPM)
+                    if generation >= max_generations:
+                        break
+
+            name = f'bars={bars},population={size},max_generations={max_generations}'
+            yield f'evolve_fixed[{name}]', evolve
+            yield f'evolve_early_stop[{name},patience={DEFAULT_PATIENCE}]', \
+                lambda evolve=evolve: evolve(patience=DEFAULT_PATIENCE)
+
+
+@benchmark('midi')
+def bench_genome_midi(config):
+    directory = tempfile.mkdtemp()
+    for bars in config['bars']:
+        genome = generate_genome(genome_length(bars))
+        yield f'render_genome_to_midi[bars={bars}]', \
+            lambda genome=genome, bars=bars: render_genome_to_midi(genome, *melody_args(bars), BPM)
+        yield f'save_genome_to_midi[bars={bars}]', \
+            lambda genome=genome, bars=bars: save_genome_to_midi(f'{directory}/0/genome.mid', genome,
+                                                                 *melody_args(bars), BPM)
+
+
+def synthetic_corpus(length, vocabulary_size, rng):
+    names = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A', 'B-', 'B']
+    # mostly single notes with a triad chord token every third entry, like the extracted corpora
+    vocabulary = sorted({'.'.join(str((i + k) % 12) for k in (0, 4, 7)) if i % 3 == 0
+                         else f'{names[i % 12]}{3 + (i // 12) % 3}' for i in range(vocabulary_size)})
+    return rng.integers(0, len(vocabulary), size=length).astype(np.int16), vocabulary
+
+
+@benchmark('midi')
+def bench_supervised_midi(config):
+    from supervised.midi_writer import estimate_key, write_midi
+
+    rng = np.random.default_rng(0)
+    tokens, vocabulary = synthetic_corpus(config['num_generate'], 60, rng)
+    prediction_output = [vocabulary[i] for i in tokens]
+    yield f'write_midi[notes={len(prediction_output)}]', lambda: write_midi(prediction_output)
+    yield f'estimate_key[notes={len(prediction_output)}]', lambda: estimate_key(prediction_output)
+
+
+@benchmark('generation')
+def bench_generation(config):
+    # a tiny randomly initialised network with the production layer stack, so no trained weights are needed
+    import keras
+    from keras.layers import BatchNormalization, Dense, Dropout, LSTM
+
+    from supervised.corpus_index import sequence_windows
+    from supervised.gen import generate_notes, render_midi
+    from supervised.incremental import create_incremental_model, generate_batch_incremental
+    from supervised.numpy_lstm import QUANTIZED_DTYPES, NumpyLSTM, export_model
+    from supervised.sampler import generate_batch, random_seeds
+
+    units = config['lstm_units']
+    sequence_length = config['sequence_length']
+    rng = np.random.default_rng(0)
+    tokens, vocabulary = synthetic_corpus(5000, 60, rng)
+    num_unique_notes = len(vocabulary)
+    int_to_note = dict(enumerate(vocabulary))
+    input_sequences = sequence_windows(tokens, sequence_length)
+
+    model = keras.Sequential([
+        keras.Input((sequence_length, 1)),
+        LSTM(units, return_sequences=True),
+        LSTM(units, return_sequences=True),
+        LSTM(units),
+        BatchNormalization(),
+        Dropout(0.3),
+        Dense(units // 2, activation='relu'),
+        BatchNormalization(),
+        Dropout(0.3),
+        Dense(num_unique_notes, activation='softmax'),
+    ])
+    incremental_model = create_incremental_model(model)
+    directory = tempfile.mkdtemp()
+    numpy_models = {dtype: NumpyLSTM.load(export_model(model, os.path.join(directory, f'{dtype}.npz'), dtype))
+                    for dtype in QUANTIZED_DTYPES}
+    num_generate = config['num_generate']
+
+    yield f'generate_notes[notes={num_generate}]', \
+        lambda: generate_notes(model, input_sequences, vocabulary, num_unique_notes, num_generate, int_to_note)
+    # create_midi is render_midi plus a single file write into the hard-coded output folder
+    prediction_output = generate_notes(model, input_sequences, vocabulary, num_unique_notes, num_generate, int_to_note)
+
+    yield f'render_midi[notes={num_generate}]', lambda: render_midi(prediction_output)
+    for batch_size in config['batch_sizes']:
+        seeds = random_seeds(input_sequences, batch_size)
+        yield f'generate_batch[batch={batch_size},notes={num_generate}]', \
+            lambda seeds=seeds: generate_batch(model, seeds, num_unique_notes, int_to_note, num_generate)
+        yield f'generate_batch_incremental[batch={batch_size},notes={num_generate}]', \
+            lambda seeds=seeds: generate_batch_incremental(incremental_model, seeds, num_unique_notes, int_to_note,
+                                                           num_generate)
+        for dtype, numpy_model in numpy_models.items():
+            yield f'generate_batch_numpy[dtype={dtype},batch={batch_size},notes={num_generate}]', \
+                lambda seeds=seeds, numpy_model=numpy_model: generate_batch_incremental(
+                    numpy_model.incremental(), seeds, num_unique_notes, int_to_note, num_generate)
+
+
+CONFIGS = {
+    'quick': {'bars': [4], 'population_sizes': [16, 256], 'generations': 3, 'num_generate': 50,
+              'batch_sizes': [1, 8], 'lstm_units': 32, 'sequence_length': 100, 'rounds': 3,
+              'max_generations': 100, 'early_stop_population_sizes': [16]},
+    'full': {'bars': [4, 16], 'population_sizes': [16, 256, 2048], 'generations': 10, 'num_generate': 200,
+             'batch_sizes': [1, 8, 32], 'lstm_units': 64, 'sequence_length': 100, 'rounds': 5,
+             'max_generations': 200, 'early_stop_population_sizes': [4, 16, 64]},
+}
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        ratio = result['median'] / previous['median']
+        marker = ''
+        if ratio > 1 + threshold:
+            marker = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name}: {previous['median'] * 1e3:.3f} ms -> {result['median'] * 1e3:.3f} ms ({ratio:.2f}x){marker}")
+    return regressions
+
+
+def next_output_path(directory, prefix='results'):
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    while os.path.exists(os.path.join(directory, f'{prefix}{count}.json')):
+        count += 1
+    return os.path.join(directory, f'{prefix}{count}.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation, GA and MIDI export hot paths")
+    parser.add_argument('--config', choices=CONFIGS, default='quick')
+    parser.add_argument('--group', action='append', help="only run these groups (ga, midi, generation)")
+    parser.add_argument('--output', help="write results as JSON to this file (default: output/results<n>.json)")
+    parser.add_argument('--compare', help="JSON results of a previous run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    config = CONFIGS[args.config]
+    random.seed(0)
+    np.random.seed(0)
+    results = {}
+    # every case binds its own inputs, so collecting them up front before timing is safe
+    for group, bench in BENCHMARKS:
+        if args.group and group not in args.group:
+            continue
+        try:
+            cases = list(bench(config))
+        except ImportError as e:
+            print(f"Skipping {bench.__name__}: {e}")
+            continue
+        for name, func in cases:
+            results[name] = dict(measure(func, config['rounds']), group=group)
+            print(f"{name}: median {results[name]['median'] * 1e3:.3f} ms")
+
+    report = {
+        'config': args.config,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created_at': time.time(),
+        'results': results,
+    }
+    output = args.output or next_output_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output'))
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import importlib
+import logging
+import sys
+import threading
+
+from metrics import metrics
+
+# the heavy stacks, imported on first use by the code that needs them rather than when the API starts
+ENGINES = {
+    'keras': 'keras',
+    'tensorflow': 'tensorflow',
+    'music21': 'music21',
+}
+
+logger = logging.getLogger(__name__)
+
+
+def load_engine(name):
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine: {name}")
+    if ENGINES[name] in sys.modules:
+        return sys.modules[ENGINES[name]]
+    with metrics.stage('engine_import', engine=name):
+        return importlib.import_module(ENGINES[name])
+
+
+def loaded_engines():
+    return {name: module in sys.modules for name, module in ENGINES.items()}
+
+
+class Preloader:
+    # imports engines and loads genre models in a background thread, so startup is not blocked on them
+    def __init__(self, engines=(), genres=(), registry=None):
+        self.engines = list(engines)
+        self.genres = list(genres)
+        self.registry = registry
+        self.errors = {}
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def start(self):
+        if not self.engines and not self.genres:
+            self._done.set()
+            return self
+        self._thread = threading.Thread(target=self._run, daemon=True, name='preload')
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def status(self):
+        return {'engines': self.engines, 'genres': self.genres, 'done': self.ready, 'errors': dict(self.errors)}
+
+    def _run(self):
+        try:
+            for name in self.engines:
+                self._load(name, load_engine, name)
+            for genre in self.genres:
+                self._load(genre, self.registry.get, genre)
+        finally:
+            self._done.set()
+
+    def _load(self, name, load, *args):
+        try:
+            load(*args)
+        except Exception as e:
+            logger.warning("Preloading %s failed: %s", name, e)
+            self.errors[name] = str(e)
@@ -0,0 +1,143 @@
+import bisect
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = 'songwriter'
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    # Counters and latency histograms keyed by (name, labels), rendered in the Prometheus text format.
+    # Collectors are called at scrape time for values that already live elsewhere (cache sizes and the like).
+    def __init__(self, namespace=NAMESPACE, buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, label_key(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage(self, stage, **labels):
+        return self.timer('stage_seconds', stage=stage, **labels)
+
+    def add_collector(self, collect):
+        # collect() returns (name, labels, value) samples; names ending in _total are typed as counters
+        self._collectors.append(collect)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(buckets), total, count))
+                                for key, (buckets, total, count) in self._histograms.items())
+        samples = sorted((name, label_key(labels), value)
+                         for collect in self._collectors for name, labels, value in collect())
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            name = f'{self.namespace}_{name}'
+            declare(name, 'counter')
+            lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        for (name, labels), (buckets, total, count) in histograms:
+            name = f'{self.namespace}_{name}'
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), buckets):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", format_value(float(bound)))])} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+        for name, labels, value in samples:
+            name = f'{self.namespace}_{name}'
+            declare(name, 'counter' if name.endswith('_total') else 'gauge')
+            lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestProfiler:
+    # cProfile for one request at a time; a request that arrives while another is profiled runs unprofiled
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not self._lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is already active in this interpreter
+            self._lock.release()
+            return None
+        return profile
+
+    def stop(self, profile, name):
+        try:
+            profile.disable()
+            os.makedirs(self.directory, exist_ok=True)
+            file_path = os.path.join(self.directory, f'{name}-{int(time.time() * 1000)}.prof')
+            profile.dump_stats(file_path)
+            return file_path
+        finally:
+            self._lock.release()
+
+
+metrics = Metrics()
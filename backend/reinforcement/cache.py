@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from reinforcement.parallel import DEFAULT_CHUNK_SIZE, score_genomes
+from reinforcement.utils import create_melody
+
+DEFAULT_MAX_ENTRIES = 100000
+
+
+def genome_key(genome):
+    genome = np.asarray(genome, dtype=np.uint8)
+    return len(genome), np.packbits(genome).tobytes()
+
+
+def genome_keys(population):
+    # genome_key for every row, packed in one call
+    matrix = np.asarray(population, dtype=np.uint8)
+    length = matrix.shape[1] if matrix.ndim == 2 else 0
+    return [(length, row.tobytes()) for row in np.packbits(matrix, axis=-1)]
+
+
+class LRUCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class FitnessCache(LRUCache):
+    def score(self, population, fitness_func, args, batch_fitness_func=None, executor=None,
+              chunk_size=DEFAULT_CHUNK_SIZE):
+        # args are the musical parameters (bars, num_notes, num_steps, pauses, key, scale, root)
+        keys = [(fitness_func.__name__, key, tuple(args)) for key in genome_keys(population)]
+        scores = [None] * len(population)
+        missing = {}
+        for i, key in enumerate(keys):
+            if key in missing:
+                # duplicates within a generation are scored once
+                missing[key].append(i)
+                continue
+            found, value = self.get(key)
+            if found:
+                scores[i] = value
+            else:
+                missing[key] = [i]
+
+        if missing:
+            genomes = [population[indices[0]] for indices in missing.values()]
+            computed = score_genomes(genomes, fitness_func, args, batch_fitness_func, executor, chunk_size)
+            for (key, indices), value in zip(missing.items(), computed):
+                self.put(key, value)
+                for i in indices:
+                    scores[i] = value
+        return scores
+
+    def melody(self, genome, *args):
+        key = ('melody', genome_key(genome), tuple(args))
+        found, melody = self.get(key)
+        if not found:
+            melody = create_melody(genome, *args)
+            self.put(key, melody)
+        return melody
@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+
+DEFAULT_PATIENCE = 20
+DEFAULT_MIN_IMPROVEMENT = 1e-6
+# mean pairwise Hamming distance, as a fraction of the genome length, below which mutation is raised
+DEFAULT_MIN_SPREAD = 0.1
+DEFAULT_MUTATION_BOOST = 2.0
+DEFAULT_MAX_MUTATION_SCALE = 8.0
+
+PLATEAU = 'plateau'
+CONVERGED = 'converged'
+MAX_GENERATIONS = 'max_generations'
+
+
+def unique_ratio(population):
+    population = np.asarray(population, dtype=np.uint8)
+    if not len(population):
+        return 0.0
+    packed = np.packbits(population, axis=1)
+    return len(np.unique(packed, axis=0)) / len(population)
+
+
+def hamming_spread(population):
+    # mean Hamming distance over all pairs, from each column's count of ones: a column with c ones
+    # differs in c * (n - c) of the n * (n - 1) / 2 pairs
+    population = np.asarray(population, dtype=np.uint8)
+    count, length = population.shape
+    if count < 2 or not length:
+        return 0.0
+    ones = population.sum(axis=0, dtype=np.int64)
+    pairs = count * (count - 1) / 2
+    return float((ones * (count - ones)).sum() / pairs / length)
+
+
+class ConvergenceMonitor:
+    # Follows a run's diversity and best fitness one generation at a time. Mutation is raised while the
+    # population is collapsing and relaxed again once it has spread out, and the run is stopped once the
+    # best fitness has not improved for `patience` generations: a plateau while the population is still
+    # diverse, or convergence when even the raised mutation could not spread it out again.
+    def __init__(self, patience=DEFAULT_PATIENCE, min_improvement=DEFAULT_MIN_IMPROVEMENT,
+                 min_spread=DEFAULT_MIN_SPREAD, mutation_boost=DEFAULT_MUTATION_BOOST,
+                 max_mutation_scale=DEFAULT_MAX_MUTATION_SCALE):
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.min_spread = min_spread
+        self.mutation_boost = mutation_boost
+        self.max_mutation_scale = max_mutation_scale
+        self.best_fitness = None
+        self.stagnant_generations = 0
+        self.mutation_scale = 1.0
+        self.stop_reason = None
+        self.last = {}
+
+    def update(self, population, scores):
+        best = max(scores) if len(scores) else None
+        if best is not None and (self.best_fitness is None or best > self.best_fitness + self.min_improvement):
+            self.best_fitness = best
+            self.stagnant_generations = 0
+        else:
+            self.stagnant_generations += 1
+
+        spread = hamming_spread(population)
+        collapsed = spread < self.min_spread
+        if collapsed:
+            self.mutation_scale = min(self.mutation_scale * self.mutation_boost, self.max_mutation_scale)
+        else:
+            self.mutation_scale = max(self.mutation_scale / self.mutation_boost, 1.0)
+
+        if self.patience and self.stagnant_generations >= self.patience:
+            self.stop_reason = CONVERGED if collapsed else PLATEAU
+
+        self.last = {
+            'unique_ratio': unique_ratio(population),
+            'hamming_spread': spread,
+            'stagnant_generations': self.stagnant_generations,
+            'mutation_scale': self.mutation_scale,
+        }
+        return self.last
+
+    def num_mutations(self, num_mutations):
+        return math.ceil(num_mutations * self.mutation_scale)
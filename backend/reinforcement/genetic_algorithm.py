@@ -1,82 +1,131 @@
-from random import choices, randint, randrange, sample
+import logging
 import random as rand
-from reinforcement.utils import create_melody, save_genome_to_midi
+import time
 
+import numpy as np
+
+from metrics import metrics
+from reinforcement.genome import GENE_DTYPE, as_matrix, crossover, mutate, numpy_generator, random_population
+from reinforcement.parallel import DEFAULT_CHUNK_SIZE, parallel_offspring, score_genomes
+from reinforcement.selection import DEFAULT_SELECTION, create_selector
+from reinforcement.utils import create_melody
 
 KEYS = ["C", "C#", "Db", "D", "D#", "Eb", "E", "F", "F#", "Gb", "G", "G#", "Ab", "A", "A#", "Bb", "B"]
 SCALES = ["major", "minorM", "dorian", "phrygian", "lydian", "mixolydian", "majorBlues", "minorBlues"]
 
-
-def initialize_population(size, genome_length):
-    return [generate_genome(genome_length) for _ in range(size)]
-
-
-def generate_genome(length):
-    return choices([0, 1], k=length)
-
-
-def single_point_crossover(a, b):
-    if len(a) != len(b):
-        raise ValueError("Genomes a and b must be of same length")
-
-    length = len(a)
-    if length < 2:
-        return a, b
-
-    p = randint(1, length - 1)
-    return a[0:p] + b[p:], b[0:p] + a[p:]
+logger = logging.getLogger(__name__)
 
 
-def mutation(genome, num=1, probability=0.5):
-    for _ in range(num):
-        index = randrange(len(genome))
-        genome[index] = genome[index] if rand.random() > probability else abs(genome[index] - 1)
-    return genome
+def initialize_population(size, genome_length, rng=rand):
+    return random_population(size, genome_length, rng)
 
 
-def selection_pair(population, fitness_func):
-    return sample(
-        population=generate_weighted_distribution(population, fitness_func),
-        k=2
-    )
+def generate_genome(length, rng=rand):
+    return random_population(1, length, rng)[0]
 
 
-def generate_weighted_distribution(population, fitness_func):
-    result = []
-    for gene in population:
-        # Convert gene (list) to a tuple to make it hashable
-        fitness_score = fitness_func(tuple(gene))
-        result += [gene] * int(fitness_score + 1)
-    return result
+def select_parents(population, scores, num_pairs, rng=rand, selection=DEFAULT_SELECTION):
+    # a (num_pairs, 2) array of row indices into population
+    start = time.perf_counter()
+    selector = create_selector(selection, range(len(population)), scores)
+    parents = np.array([selector(rng) for _ in range(2 * num_pairs)], dtype=np.intp).reshape(num_pairs, 2)
+    metrics.observe('stage_seconds', time.perf_counter() - start, stage='select')
+    return parents
 
 
-def generate_next_generation(population, population_fitness, num_mutations, mutation_probability):
-    next_generation = population[:2]
-    fitness_dict = {tuple(g): fitness for g, fitness in population_fitness}
-    for _ in range((len(population) // 2) - 1):
-        parents = selection_pair(population, fitness_dict.get)
-        offspring_a, offspring_b = single_point_crossover(parents[0], parents[1])
-        offspring_a = mutation(offspring_a, num=num_mutations, probability=mutation_probability)
-        offspring_b = mutation(offspring_b, num=num_mutations, probability=mutation_probability)
-        next_generation.extend([offspring_a, offspring_b])
+def breed(mothers, fathers, num_mutations, mutation_probability, rng=rand, out=None):
+    # one offspring pair per row of mothers and fathers, written to consecutive rows of out
+    num_pairs, length = mothers.shape
+    if out is None:
+        out = np.empty((2 * num_pairs, length), dtype=GENE_DTYPE)
+    generator = numpy_generator(rng)
+    if length < 2:
+        points = np.full(num_pairs, length)
+    else:
+        points = generator.integers(1, length, size=num_pairs)
+    crossover(mothers, fathers, points, out[0::2], out[1::2])
+    mutate(out, num_mutations, mutation_probability, generator)
+    return out
+
+
+def generate_offspring(population, scores, num_pairs, num_mutations, mutation_probability, rng=rand,
+                       selection=DEFAULT_SELECTION, out=None):
+    # scores line up with the rows of population
+    population = as_matrix(population)
+    parents = select_parents(population, scores, num_pairs, rng, selection)
+    start = time.perf_counter()
+    out = breed(population[parents[:, 0]], population[parents[:, 1]], num_mutations, mutation_probability, rng,
+                out)
+    metrics.observe('stage_seconds', time.perf_counter() - start, stage='mutate')
+    return out
+
+
+def generate_next_generation(population, scores, num_mutations, mutation_probability, rng=rand,
+                             executor=None, chunk_size=DEFAULT_CHUNK_SIZE, selection=DEFAULT_SELECTION):
+    # population is sorted best first; the two best carry over and offspring fill the rest of one new buffer
+    population = as_matrix(population)
+    num_pairs = max((len(population) // 2) - 1, 0)
+    num_elite = min(2, len(population))
+    next_generation = np.empty((num_elite + 2 * num_pairs, population.shape[1]), dtype=GENE_DTYPE)
+    next_generation[:num_elite] = population[:num_elite]
+    offspring = next_generation[num_elite:]
+    if executor is None:
+        generate_offspring(population, scores, num_pairs, num_mutations, mutation_probability, rng, selection,
+                           out=offspring)
+    else:
+        parents = select_parents(population, scores, num_pairs, rng, selection)
+        parallel_offspring(breed, population[parents[:, 0]], population[parents[:, 1]], num_mutations,
+                           mutation_probability, rng, executor, chunk_size, out=offspring)
     return next_generation
 
 
-def evaluate_population(population, fitness_func, *args):
-    population_fitness = [(genome, fitness_func(genome, *args)) for genome in population]
-    sorted_population_fitness = sorted(population_fitness, key=lambda e: e[1], reverse=True)
-    return [e[0] for e in sorted_population_fitness], population_fitness
-
-
-def run_evolution(population_size, genome_length, fitness_func, num_mutations, mutation_probability, *fitness_args):
-    population = initialize_population(population_size, genome_length)
-    population_id = 0
+def evaluate_population(population, fitness_func, *args, batch_fitness_func=None, cache=None, executor=None,
+                        chunk_size=DEFAULT_CHUNK_SIZE):
+    population = as_matrix(population)
+    if cache is not None:
+        scores = cache.score(population, fitness_func, args, batch_fitness_func, executor, chunk_size)
+    else:
+        scores = score_genomes(population, fitness_func, args, batch_fitness_func, executor, chunk_size)
+    population_fitness = list(zip(population, scores))
+    # a stable sort, so equal scores keep their shuffled order
+    order = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+    return population[order], [scores[i] for i in order], population_fitness
+
+
+def run_evolution(population_size, genome_length, fitness_func, num_mutations, mutation_probability, *fitness_args,
+                  batch_fitness_func=None, cache=None, executor=None, chunk_size=DEFAULT_CHUNK_SIZE, seed=None,
+                  selection=DEFAULT_SELECTION, rng=None, population=None, start_generation=0, monitor=None):
+    # a seed makes the run reproducible, though a run with an executor breeds differently from one without
+    # (see parallel_offspring); a checkpointed rng, population and generation number continue a run exactly
+    # where it stopped. A ConvergenceMonitor adapts the number of mutations to the population's diversity
+    # and ends the run once it stagnates.
+    if rng is None:
+        rng = rand if seed is None else rand.Random(seed)
+    if population is None:
+        population = initialize_population(population_size, genome_length, rng)
+    else:
+        population = as_matrix(population)
+    population_id = start_generation
     running = True
 
     while running:
-        rand.shuffle(population)
-        population, population_fitness = evaluate_population(population, fitness_func, *fitness_args)
-        next_generation = generate_next_generation(population, population_fitness, num_mutations, mutation_probability)
+        order = list(range(len(population)))
+        rng.shuffle(order)
+        population = population[order]
+        with metrics.stage('evaluate'):
+            population, scores, population_fitness = evaluate_population(
+                population, fitness_func, *fitness_args, batch_fitness_func=batch_fitness_func, cache=cache,
+                executor=executor, chunk_size=chunk_size)
+        generation_mutations = num_mutations
+        if monitor is not None:
+            monitor.update(population, scores)
+            generation_mutations = monitor.num_mutations(num_mutations)
+            running = monitor.stop_reason is None
+        with metrics.stage('offspring'):
+            next_generation = generate_next_generation(population, scores, generation_mutations,
+                                                       mutation_probability, rng, executor, chunk_size, selection)
+        metrics.inc('ga_generations_total')
+        metrics.inc('ga_genomes_evaluated_total', len(population))
         yield population_id, population, next_generation, population_fitness
         population = next_generation
         population_id += 1
@@ -106,5 +155,5 @@ def fitness_automated(genome, bars, num_notes, num_steps, pauses, key, scale, ro
     rhythmic_patterns = set(tuple(zip(map(tuple, melody["notes"]), melody["beat"])))
     diversity_score += len(rhythmic_patterns)
     fitness_score = pitch_range + contour_changes - note_repetition_penalty - scale_conformance + rhythmic_variety - diversity_score
-    print(fitness_score)
+    logger.debug("Fitness score: %s", fitness_score)
     return fitness_score
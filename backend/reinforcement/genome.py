@@ -0,0 +1,44 @@
+import random as rand
+
+import numpy as np
+
+# one byte per gene, one row per genome
+GENE_DTYPE = np.uint8
+
+
+def as_matrix(population):
+    return np.asarray(population, dtype=GENE_DTYPE)
+
+
+def random_population(size, length, rng=rand):
+    # a single draw from the run's generator, so seeded runs stay reproducible
+    count = size * length
+    bits = rng.getrandbits(count) if count else 0
+    packed = np.frombuffer(bits.to_bytes((count + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(packed, count=count, bitorder='little').reshape(size, length)
+
+
+def numpy_generator(rng=rand):
+    return np.random.default_rng(rng.getrandbits(64))
+
+
+def crossover(parents_a, parents_b, points, out_a, out_b):
+    # single-point crossover of every pair at once: genes before a pair's point come from its first parent
+    mask = np.arange(parents_a.shape[1]) < np.asarray(points)[:, np.newaxis]
+    np.copyto(out_a, parents_b)
+    np.copyto(out_a, parents_a, where=mask)
+    np.copyto(out_b, parents_a)
+    np.copyto(out_b, parents_b, where=mask)
+
+
+def mutate(matrix, num, probability, generator):
+    # num random positions per genome, each flipped with the given probability; bitwise_xor.at applies
+    # repeated positions one after another, so a position drawn twice can flip back
+    rows, length = matrix.shape
+    if not rows or not length or num <= 0:
+        return matrix
+    positions = generator.integers(0, length, size=(rows, num))
+    flips = (generator.random((rows, num)) <= probability).astype(GENE_DTYPE)
+    genomes = np.broadcast_to(np.arange(rows)[:, np.newaxis], positions.shape)
+    np.bitwise_xor.at(matrix, (genomes, positions), flips)
+    return matrix
@@ -0,0 +1,209 @@
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_PENDING = 16
+DEFAULT_MAX_OWN_THREADS = 32
+DEFAULT_RESULT_TTL = 3600
+DEFAULT_CLEANUP_INTERVAL = 60
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class EvolutionJob:
+    def __init__(self, params, folder=None, job_id=None, start_generation=0, own_thread=False):
+        self.id = job_id or uuid.uuid4().hex
+        self.params = params
+        self.folder = folder
+        self.own_thread = own_thread
+        # resumed and forked runs publish progress from this generation on
+        self.start_generation = start_generation
+        self.status = QUEUED
+        self.error = None
+        # why a finished run stopped: max_generations, or plateau/converged when it stopped early
+        self.stop_reason = None
+        self.progress = []
+        self.results = {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._condition = threading.Condition()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def cancel(self):
+        self._cancel.set()
+        with self._condition:
+            if self.status == QUEUED:
+                self._finish(CANCELLED)
+            self._condition.notify_all()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.id)
+
+    def publish(self, event):
+        with self._condition:
+            self.progress.append(event)
+            self._condition.notify_all()
+
+    def set_status(self, status, error=None):
+        with self._condition:
+            if status in FINISHED_STATES:
+                self._finish(status, error)
+            else:
+                self.status = status
+            self._condition.notify_all()
+
+    def wait_for_progress(self, count, timeout=None):
+        # blocks until at least `count` progress events exist or the job finishes
+        with self._condition:
+            self._condition.wait_for(lambda: len(self.progress) >= count or self.finished, timeout)
+            return len(self.progress) >= count
+
+    def events(self, start=0, timeout=None):
+        index = start
+        while True:
+            self.wait_for_progress(index + 1, timeout)
+            with self._condition:
+                pending = self.progress[index:]
+                finished = self.finished
+            for event in pending:
+                yield event
+            index += len(pending)
+            if finished and index >= len(self.progress):
+                return
+            if not pending:
+                # timed out without progress; let the caller send a keep-alive
+                yield None
+
+    def to_dict(self):
+        with self._condition:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'start_generation': self.start_generation,
+                'error': self.error,
+                'stop_reason': self.stop_reason,
+                'generations_done': len(self.progress),
+                'progress': list(self.progress),
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+            }
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+
+
+class JobManager:
+    # Evolutions run in threads of this process and the GA's Python code holds the GIL while it runs, so
+    # every running job slows down request handling. max_workers bounds how many run at once and
+    # max_pending how many may wait for a worker; the API moves scoring and breeding into processes
+    # with GA_PROCESSES. Jobs submitted with own_thread spend most of their time waiting (for human
+    # ratings), so they get a thread of their own instead of holding a pool worker, up to max_own_threads.
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, result_ttl=DEFAULT_RESULT_TTL, on_finish=None,
+                 max_pending=DEFAULT_MAX_PENDING, cleanup_interval=DEFAULT_CLEANUP_INTERVAL, on_start=None,
+                 max_own_threads=DEFAULT_MAX_OWN_THREADS):
+        self.result_ttl = result_ttl
+        self.on_start = on_start
+        self.on_finish = on_finish
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_own_threads = max_own_threads
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='evolution')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.cleanup_interval = cleanup_interval
+        self._stopped = threading.Event()
+        self._cleaner = None
+
+    def start(self):
+        # expired results are dropped even while no new job is submitted
+        self._cleaner = threading.Thread(target=self._clean_periodically, args=(self.cleanup_interval,),
+                                         daemon=True, name='job-cleanup')
+        self._cleaner.start()
+        return self
+
+    def submit(self, run, params, folder=None, job_id=None, start_generation=0, own_thread=False):
+        self.cleanup()
+        job = EvolutionJob(params, folder, job_id, start_generation, own_thread)
+        limit = self.max_own_threads if own_thread else self.max_workers + self.max_pending
+        with self._lock:
+            unfinished = sum(not other.finished and other.own_thread == own_thread for other in self._jobs.values())
+            if unfinished >= limit:
+                raise JobQueueFull(f"{unfinished} evolutions are already running or queued")
+            self._jobs[job.id] = job
+        if own_thread:
+            threading.Thread(target=self._run, args=(job, run), daemon=True, name=f'evolution-{job.id}').start()
+        else:
+            self._executor.submit(self._run, job, run)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def cleanup(self):
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished and now - job.finished_at > self.result_ttl]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            if job.folder:
+                shutil.rmtree(job.folder, ignore_errors=True)
+        return len(expired)
+
+    def stop(self):
+        self._stopped.set()
+
+    def _clean_periodically(self, interval):
+        while not self._stopped.wait(interval):
+            self.cleanup()
+
+    def _run(self, job, run):
+        if not job.finished:
+            job.set_status(RUNNING)
+            try:
+                if self.on_start is not None:
+                    self.on_start(job)
+                run(job)
+            except JobCancelled:
+                job.set_status(CANCELLED)
+            except Exception as e:
+                job.set_status(FAILED, str(e))
+            else:
+                job.set_status(CANCELLED if job.cancelled else DONE)
+        if self.on_finish is not None:
+            self.on_finish(job)
@@ -0,0 +1,68 @@
+import logging
+import random as rand
+import time
+
+import numpy as np
+
+from metrics import metrics
+
+DEFAULT_CHUNK_SIZE = 64
+
+
+def chunked(items, chunk_size):
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def init_worker(log_level):
+    # spawned workers re-import the main module, which must keep its threads out of import (see api.py's
+    # start_services), then set up logging and import the GA once rather than per task
+    logging.basicConfig(level=log_level)
+    import reinforcement.genetic_algorithm  # noqa: F401
+    import reinforcement.vectorized  # noqa: F401
+
+
+def score_chunk(genomes, fitness_func, args, batch_fitness_func=None):
+    if batch_fitness_func is not None:
+        return list(batch_fitness_func(genomes, *args))
+    return [fitness_func(genome, *args) for genome in genomes]
+
+
+def score_genomes(genomes, fitness_func, args, batch_fitness_func=None, executor=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    # the fitness cache is consulted before this in the calling process, so its hits and misses are
+    # counted there; only the genomes it misses are sent to the workers
+    if executor is None or len(genomes) <= chunk_size:
+        return score_chunk(genomes, fitness_func, args, batch_fitness_func)
+    chunks = chunked(list(genomes), chunk_size)
+    results = executor.map(score_chunk, chunks, [fitness_func] * len(chunks), [args] * len(chunks),
+                           [batch_fitness_func] * len(chunks))
+    return [score for chunk_scores in results for score in chunk_scores]
+
+
+def offspring_chunk(breed, mothers, fathers, num_mutations, mutation_probability, seed):
+    # timed here, since metrics recorded in a worker never reach the API's /metrics
+    start = time.perf_counter()
+    offspring = breed(mothers, fathers, num_mutations, mutation_probability, rand.Random(seed))
+    return offspring, time.perf_counter() - start
+
+
+def parallel_offspring(breed, mothers, fathers, num_mutations, mutation_probability, rng, executor,
+                       chunk_size=DEFAULT_CHUNK_SIZE, out=None):
+    # Parents are selected by the caller, so a chunk only carries the parent rows it breeds. Every chunk
+    # gets its own seed drawn from the run's generator, so results do not depend on which worker runs
+    # which chunk: a seeded run is reproducible for a given chunk size, but breeds different offspring
+    # than the same run without an executor, which draws all crossover points and mutations from one
+    # generator.
+    num_pairs = len(mothers)
+    starts = range(0, num_pairs, chunk_size)
+    seeds = [rng.getrandbits(64) for _ in starts]
+    futures = [executor.submit(offspring_chunk, breed, mothers[start:start + chunk_size],
+                               fathers[start:start + chunk_size], num_mutations, mutation_probability, seed)
+               for start, seed in zip(starts, seeds)]
+    if out is None:
+        out = np.empty((2 * num_pairs, mothers.shape[1]), dtype=mothers.dtype)
+    for start, future in zip(starts, futures):
+        chunk, seconds = future.result()
+        out[2 * start:2 * start + len(chunk)] = chunk
+        metrics.observe('stage_seconds', seconds, stage='mutate')
+    return out
@@ -0,0 +1,99 @@
+import threading
+import time
+
+DEFAULT_RATING_TIMEOUT = 600
+# how often a waiting evolution checks whether its job was cancelled
+CANCEL_POLL_INTERVAL = 1.0
+
+
+class RatingQueue:
+    # One rating-mode run's ratings, indexed by generation and genome index. /rate_melody puts ratings, and
+    # the evolution thread waits on the condition until the generation it is scoring is complete, so it
+    # advances as soon as the last rating arrives.
+    def __init__(self):
+        self._ratings = {}
+        self._generation = None
+        self._size = 0
+        self._scored = -1
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def expect(self, generation, size):
+        with self._condition:
+            self._generation = generation
+            self._size = size
+            self._ratings.setdefault(generation, {})
+
+    def put(self, genome_index, rating, generation=None):
+        return bool(self.put_many({genome_index: rating}, generation))
+
+    def put_many(self, ratings, generation=None):
+        # generation None rates the generation that is currently waiting; ratings of generations that were
+        # already scored, or of genomes outside the waiting population, are not accepted
+        with self._condition:
+            if generation is None:
+                generation = self._generation
+            if generation is None or generation <= self._scored:
+                return {}
+            accepted = {genome_index: rating for genome_index, rating in ratings.items()
+                        if genome_index >= 0 and (generation != self._generation or genome_index < self._size)}
+            self._ratings.setdefault(generation, {}).update(accepted)
+            if accepted:
+                self._condition.notify_all()
+            return accepted
+
+    def wait(self, generation, size, timeout=None, default=0, cancelled=None):
+        # the ratings of genomes 0..size-1, with `default` for those still missing at the timeout
+        self.expect(generation, size)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            received = self._ratings[generation]
+            while len(received) < size and not self._closed:
+                if cancelled is not None and cancelled():
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(CANCEL_POLL_INTERVAL if remaining is None else
+                                     min(remaining, CANCEL_POLL_INTERVAL))
+            self._scored = generation
+            self._generation = None
+            scores = [received.get(index, default) for index in range(size)]
+            missing = size - sum(index in received for index in range(size))
+            del self._ratings[generation]
+        return scores, missing
+
+    def status(self):
+        with self._condition:
+            received = self._ratings.get(self._generation, {}) if self._generation is not None else {}
+            return {
+                'generation': self._generation,
+                'size': self._size if self._generation is not None else 0,
+                'received': sorted(received),
+            }
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class RatingSessions:
+    def __init__(self):
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def open(self, session_id):
+        with self._lock:
+            queue = self._queues[session_id] = RatingQueue()
+            return queue
+
+    def get(self, session_id):
+        with self._lock:
+            return self._queues.get(session_id)
+
+    def close(self, session_id):
+        with self._lock:
+            queue = self._queues.pop(session_id, None)
+        if queue is not None:
+            queue.close()
@@ -0,0 +1,82 @@
+import sys
+
+import numpy as np
+
+# the roots, scales and fallbacks of pyo's EventScale, which create_melody used to build on every call
+ROOT_DEGREES = {
+    "C": 0, "C#": 1, "Db": 1, "D": 2, "D#": 3, "Eb": 3, "E": 4, "F": 5, "F#": 6,
+    "Gb": 6, "G": 7, "G#": 8, "Ab": 8, "A": 9, "A#": 10, "Bb": 10, "B": 11,
+}
+SCALE_INTERVALS = {
+    "major": [0, 2, 4, 5, 7, 9, 11],
+    "minorH": [0, 2, 3, 5, 7, 8, 11],
+    "minorM": [0, 2, 3, 5, 7, 9, 11],
+    "ionian": [0, 2, 4, 5, 7, 9, 11],
+    "dorian": [0, 2, 3, 5, 7, 9, 10],
+    "phrygian": [0, 1, 3, 5, 7, 8, 10],
+    "lydian": [0, 2, 4, 6, 7, 9, 11],
+    "mixolydian": [0, 2, 4, 5, 7, 9, 10],
+    "aeolian": [0, 2, 3, 5, 7, 8, 10],
+    "locrian": [0, 1, 3, 5, 6, 8, 10],
+    "wholeTone": [0, 2, 4, 6, 8, 10],
+    "majorPenta": [0, 2, 4, 7, 9],
+    "minorPenta": [0, 3, 5, 7, 10],
+    "egyptian": [0, 2, 5, 7, 10],
+    "majorBlues": [0, 2, 5, 7, 9],
+    "minorBlues": [0, 3, 5, 8, 10],
+    "minorHungarian": [0, 2, 3, 6, 7, 8, 11],
+}
+DEFAULT_ROOT = "C"
+DEFAULT_SCALE = "major"
+SCALE_OCTAVES = 2
+# first octaves with a precomputed row; anything else is built on demand
+FIRST_OCTAVES = range(0, 10)
+
+
+def build_scale(key, scale, first, octaves=SCALE_OCTAVES):
+    degree = ROOT_DEGREES.get(key, ROOT_DEGREES[DEFAULT_ROOT])
+    intervals = np.array(SCALE_INTERVALS.get(scale, SCALE_INTERVALS[DEFAULT_SCALE]), dtype=np.int64)
+    positions = np.arange(len(intervals) * octaves + 1)
+    return intervals[positions % len(intervals)] + (first + positions // len(intervals)) * 12 + degree
+
+
+def build_tables():
+    # (key, scale) -> (len(FIRST_OCTAVES), scale length) MIDI pitches, one row per first octave
+    tables = {}
+    for key in ROOT_DEGREES:
+        for scale in SCALE_INTERVALS:
+            table = np.array([build_scale(key, scale, first) for first in FIRST_OCTAVES])
+            table.setflags(write=False)
+            tables[(key, scale)] = table
+    return tables
+
+
+SCALE_TABLES = build_tables()
+
+
+def scale_pitches(key, scale, first):
+    key = key if key in ROOT_DEGREES else DEFAULT_ROOT
+    scale = scale if scale in SCALE_INTERVALS else DEFAULT_SCALE
+    if first in FIRST_OCTAVES:
+        return SCALE_TABLES[(key, scale)][first - FIRST_OCTAVES.start]
+    return build_scale(key, scale, first)
+
+
+def check_scale_parity(firsts=FIRST_OCTAVES):
+    # offline check against pyo, which is only imported here
+    from pyo import EventScale
+
+    mismatches = []
+    for key in list(ROOT_DEGREES) + ["H"]:
+        for scale in list(SCALE_INTERVALS) + ["unknown"]:
+            for first in firsts:
+                expected = list(EventScale(root=key, scale=scale, first=first))
+                if scale_pitches(key, scale, first).tolist() != expected:
+                    mismatches.append((key, scale, first))
+    return mismatches
+
+
+if __name__ == "__main__":
+    mismatches = check_scale_parity(range(-1, 12))
+    print(f"{len(mismatches)} mismatches {mismatches}")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,66 @@
+import random as rand
+from bisect import bisect_right
+from itertools import accumulate
+
+DEFAULT_SELECTION = 'roulette'
+DEFAULT_TOURNAMENT_SIZE = 3
+DEFAULT_ELITE_FRACTION = 0.5
+
+
+def cumulative_draw(population, weights):
+    cumulative = list(accumulate(weights))
+    total = cumulative[-1]
+    last = len(population) - 1
+
+    def draw(rng=rand):
+        return population[min(bisect_right(cumulative, rng.random() * total), last)]
+
+    return draw
+
+
+def roulette(population, scores):
+    # shift so the weakest genome keeps weight 1 instead of being dropped for a negative score
+    offset = 1 - min(min(scores), 0)
+    return cumulative_draw(population, [score + offset for score in scores])
+
+
+def rank(population, scores):
+    order = sorted(range(len(population)), key=lambda i: scores[i])
+    weights = [0] * len(population)
+    for position, i in enumerate(order):
+        weights[i] = position + 1
+    return cumulative_draw(population, weights)
+
+
+def tournament(population, scores, size=DEFAULT_TOURNAMENT_SIZE):
+    size = min(size, len(population))
+
+    def draw(rng=rand):
+        contenders = rng.sample(range(len(population)), size)
+        return population[max(contenders, key=lambda i: scores[i])]
+
+    return draw
+
+
+def elitist(population, scores, fraction=DEFAULT_ELITE_FRACTION):
+    count = max(1, int(len(population) * fraction))
+    elite = sorted(range(len(population)), key=lambda i: scores[i], reverse=True)[:count]
+
+    def draw(rng=rand):
+        return population[elite[rng.randrange(count)]]
+
+    return draw
+
+
+SELECTION_STRATEGIES = {
+    'roulette': roulette,
+    'rank': rank,
+    'tournament': tournament,
+    'elitist': elitist,
+}
+
+
+def create_selector(strategy, population, scores):
+    if strategy not in SELECTION_STRATEGIES:
+        raise ValueError(f"Unknown selection strategy: {strategy}")
+    return SELECTION_STRATEGIES[strategy](population, scores)
@@ -0,0 +1,210 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    stop_reason TEXT,
+    parent_id TEXT,
+    parent_generation INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+CREATE TABLE IF NOT EXISTS generations (
+    run_id TEXT NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    generation INTEGER NOT NULL,
+    genome_length INTEGER NOT NULL,
+    population BLOB NOT NULL,
+    scores TEXT NOT NULL,
+    next_population BLOB NOT NULL,
+    rng_state TEXT NOT NULL,
+    best_index INTEGER NOT NULL,
+    best_fitness REAL NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (run_id, generation)
+);
+CREATE TABLE IF NOT EXISTS ratings (
+    run_id TEXT NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    generation INTEGER NOT NULL,
+    genome_index INTEGER NOT NULL,
+    rating REAL NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (run_id, generation, genome_index)
+);
+"""
+
+
+def pack_population(matrix):
+    # one bit per gene; the row count and genome length are stored next to the blob
+    return np.packbits(np.asarray(matrix, dtype=np.uint8), axis=1).tobytes()
+
+
+def unpack_population(blob, genome_length):
+    packed = np.frombuffer(blob, dtype=np.uint8)
+    row_bytes = (genome_length + 7) // 8
+    if not row_bytes:
+        return np.empty((0, genome_length), dtype=np.uint8)
+    return np.unpackbits(packed.reshape(-1, row_bytes), axis=1, count=genome_length)
+
+
+def dump_rng_state(state):
+    return json.dumps(state)
+
+
+def load_rng_state(text):
+    version, internal_state, gauss_next = json.loads(text)
+    return version, tuple(internal_state), gauss_next
+
+
+class RunStore:
+    # One SQLite file holds every run's parameters and a checkpoint per generation. A checkpoint keeps the
+    # evaluated population, its scores, the bred next generation and the generator state after breeding,
+    # which is everything run_evolution needs to continue exactly where the run stopped.
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._open_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    @property
+    def _connection(self):
+        # opened on first use, so creating the store does not touch the file system
+        with self._open_lock:
+            if self._db is None:
+                self._db = self._open()
+            return self._db
+
+    def _open(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        with connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.executescript(SCHEMA)
+            columns = [row['name'] for row in connection.execute("PRAGMA table_info(runs)")]
+            if 'stop_reason' not in columns:
+                # stores created before runs could stop early
+                connection.execute("ALTER TABLE runs ADD COLUMN stop_reason TEXT")
+        return connection
+
+    def create_run(self, run_id, params, status, parent_id=None, parent_generation=None):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO runs (id, params, status, parent_id, parent_generation, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, json.dumps(params), status, parent_id, parent_generation, now, now))
+            if parent_id is not None:
+                # a fork shares its parent's history up to the fork point
+                self._connection.execute(
+                    "INSERT INTO generations SELECT ?, generation, genome_length, population, scores, "
+                    "next_population, rng_state, best_index, best_fitness, created_at FROM generations "
+                    "WHERE run_id = ? AND generation <= ?",
+                    (run_id, parent_id, parent_generation))
+
+    def update_run(self, run_id, params, status):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE runs SET params = ?, status = ?, error = NULL, stop_reason = NULL, updated_at = ? WHERE id = ?",
+                (json.dumps(params), status, time.time(), run_id))
+
+    def set_status(self, run_id, status, error=None, stop_reason=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE runs SET status = ?, error = ?, stop_reason = ?, updated_at = ? WHERE id = ?",
+                (status, error, stop_reason, time.time(), run_id))
+
+    def save_generation(self, run_id, generation, population, scores, next_population, rng_state, best_index,
+                        best_fitness):
+        population = np.asarray(population, dtype=np.uint8)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, generation, population.shape[1], pack_population(population), json.dumps(list(scores)),
+                 pack_population(next_population), dump_rng_state(rng_state), best_index, best_fitness,
+                 time.time()))
+            self._connection.execute("UPDATE runs SET updated_at = ? WHERE id = ?", (time.time(), run_id))
+
+    def save_rating(self, run_id, generation, genome_index, rating):
+        self.save_ratings(run_id, generation, {genome_index: rating})
+
+    def save_ratings(self, run_id, generation, ratings):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO ratings VALUES (?, ?, ?, ?, ?)",
+                                         [(run_id, generation, genome_index, rating, now)
+                                          for genome_index, rating in ratings.items()])
+
+    def get_run(self, run_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT runs.*, COUNT(generations.generation) AS generations, MAX(generations.generation) AS "
+                "last_generation, MAX(generations.best_fitness) AS best_fitness FROM runs LEFT JOIN generations "
+                "ON generations.run_id = runs.id WHERE runs.id = ? GROUP BY runs.id", (run_id,)).fetchone()
+        return self._run_dict(row) if row is not None else None
+
+    def list_runs(self, limit=50):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT runs.*, COUNT(generations.generation) AS generations, MAX(generations.generation) AS "
+                "last_generation, MAX(generations.best_fitness) AS best_fitness FROM runs LEFT JOIN generations "
+                "ON generations.run_id = runs.id GROUP BY runs.id ORDER BY runs.created_at DESC LIMIT ?",
+                (limit,)).fetchall()
+        return [self._run_dict(row) for row in rows]
+
+    def generation_summaries(self, run_id):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT generation, best_fitness, created_at FROM generations WHERE run_id = ? ORDER BY generation",
+                (run_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def load_generation(self, run_id, generation=None):
+        # generation None loads the latest checkpoint
+        with self._lock:
+            if generation is None:
+                row = self._connection.execute(
+                    "SELECT * FROM generations WHERE run_id = ? ORDER BY generation DESC LIMIT 1",
+                    (run_id,)).fetchone()
+            else:
+                row = self._connection.execute(
+                    "SELECT * FROM generations WHERE run_id = ? AND generation = ?", (run_id, generation)).fetchone()
+        if row is None:
+            return None
+        return {
+            'generation': row['generation'],
+            'population': unpack_population(row['population'], row['genome_length']),
+            'scores': json.loads(row['scores']),
+            'next_population': unpack_population(row['next_population'], row['genome_length']),
+            'rng_state': load_rng_state(row['rng_state']),
+            'best_index': row['best_index'],
+            'best_fitness': row['best_fitness'],
+        }
+
+    def ratings(self, run_id, generation):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT genome_index, rating FROM ratings WHERE run_id = ? AND generation = ? ORDER BY genome_index",
+                (run_id, generation)).fetchall()
+        return {row['genome_index']: row['rating'] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def _run_dict(row):
+        run = dict(row)
+        run['params'] = json.loads(run['params'])
+        return run
@@ -1,24 +1,28 @@
 from midiutil import MIDIFile
-from pyo import *
+from reinforcement.scales import scale_pitches
+import io
 import os
+import numpy as np
 
 BITS_PER_NOTE = 4
+BIT_WEIGHTS = np.array([1 << i for i in range(BITS_PER_NOTE)], dtype=np.uint8)
 
 
-def int_from_bits(bits):
-    return int(sum([bit * pow(2, index) for index, bit in enumerate(bits)]))
+def note_integers(genome, count):
+    # the little-endian value of each BITS_PER_NOTE-bit group, for list and uint8 row genomes alike
+    bits = np.asarray(genome, dtype=np.uint8)[:count * BITS_PER_NOTE]
+    return bits.reshape(count, BITS_PER_NOTE).dot(BIT_WEIGHTS).tolist()
 
 
 def create_melody(genome, bars, num_notes, num_steps, pauses, key, scale, root):
-    notes = [genome[i * BITS_PER_NOTE:i * BITS_PER_NOTE + BITS_PER_NOTE] for i in range(bars * num_notes)]
+    integers = note_integers(genome, bars * num_notes)
     note_length = 4 / float(num_notes)
-    scl = EventScale(root=key, scale=scale, first=root)
+    scl = scale_pitches(key, scale, root)
     max_int = pow(2, BITS_PER_NOTE - 1)
 
     melody = {"notes": [], "velocity": [], "beat": []}
 
-    for i, note in enumerate(notes):
-        integer = int_from_bits(note)
+    for integer in integers:
         if not pauses:
             integer %= max_int
 
@@ -34,14 +38,17 @@ def create_melody(genome, bars, num_notes, num_steps, pauses, key, scale, root):
         melody["velocity"].append(velocity)
         melody["beat"].append(beat)
 
-    steps = [[scl[(note + step * 2) % len(scl)] for note in melody["notes"]] for step in range(num_steps)]
-    melody["notes"] = steps
+    degrees = np.array(melody["notes"], dtype=np.int64) + np.arange(num_steps).reshape(-1, 1) * 2
+    melody["notes"] = scl[degrees % len(scl)].tolist()
 
     return melody
 
 
-def save_genome_to_midi(filename, genome, bars, num_notes, num_steps, pauses, key, scale, root, bpm):
-    melody = create_melody(genome, bars, num_notes, num_steps, pauses, key, scale, root)
+def render_genome_to_midi(genome, bars, num_notes, num_steps, pauses, key, scale, root, bpm, cache=None):
+    if cache is not None:
+        melody = cache.melody(genome, bars, num_notes, num_steps, pauses, key, scale, root)
+    else:
+        melody = create_melody(genome, bars, num_notes, num_steps, pauses, key, scale, root)
 
     if len(melody["notes"][0]) != len(melody["beat"]) or len(melody["notes"][0]) != len(melody["velocity"]):
         raise ValueError
@@ -62,6 +69,13 @@ def save_genome_to_midi(filename, genome, bars, num_notes, num_steps, pauses, ke
 
         time += melody["beat"][i]
 
+    buffer = io.BytesIO()
+    mf.writeFile(buffer)
+    return buffer.getvalue()
+
+
+def save_genome_to_midi(filename, genome, bars, num_notes, num_steps, pauses, key, scale, root, bpm, cache=None):
+    midi_bytes = render_genome_to_midi(genome, bars, num_notes, num_steps, pauses, key, scale, root, bpm, cache)
     os.makedirs(os.path.dirname(filename), exist_ok=True)
     with open(filename, "wb") as f:
-        mf.writeFile(f)
+        f.write(midi_bytes)
@@ -0,0 +1,90 @@
+import numpy as np
+
+from reinforcement.scales import scale_pitches
+from reinforcement.utils import BIT_WEIGHTS, BITS_PER_NOTE
+
+SCALE_DEGREES = 8
+
+
+def population_to_matrix(population):
+    return np.asarray(population, dtype=np.uint8)
+
+
+def decode_population(matrix, pauses):
+    # (population, genome_length) bits -> (population, notes) values plus the mask of notes kept by create_melody
+    num_genomes = matrix.shape[0]
+    integers = matrix.reshape(num_genomes, -1, BITS_PER_NOTE).dot(BIT_WEIGHTS).astype(np.int64)
+    max_int = 1 << (BITS_PER_NOTE - 1)
+    if not pauses:
+        integers %= max_int
+    is_note = integers < max_int
+    values = np.where(is_note, integers, 0)
+
+    # create_melody merges a note into the previous entry when it repeats that entry's value,
+    # and the previous entry's value is always the value at the previous position
+    kept = np.ones_like(is_note)
+    kept[:, 1:] = ~(is_note[:, 1:] & (values[:, 1:] == values[:, :-1]))
+    return values, kept
+
+
+def run_lengths(kept):
+    # (population, notes) lengths of every kept entry in order, zero padded; an entry's beat is its length * note_length
+    num_genomes, num_positions = kept.shape
+    starts = np.flatnonzero(kept)
+    rows = starts // num_positions
+    ends = np.minimum(np.append(starts[1:], kept.size), (rows + 1) * num_positions)
+    lengths = np.zeros(kept.shape, dtype=np.int64)
+    lengths[rows, np.cumsum(kept, axis=1)[kept] - 1] = ends - starts
+    return lengths
+
+
+def count_distinct(values, valid, size, offset=0):
+    rows = np.broadcast_to(np.arange(values.shape[0]).reshape((-1,) + (1,) * (values.ndim - 1)), values.shape)
+    present = np.zeros((values.shape[0], size), dtype=bool)
+    present[rows[valid], values[valid] + offset] = True
+    return present.sum(axis=1)
+
+
+def fitness_population(population, bars, num_notes, num_steps, pauses, key, scale, root):
+    matrix = population_to_matrix(population)
+    num_genomes = matrix.shape[0]
+    values, kept = decode_population(matrix, pauses)
+    scl = scale_pitches(key, scale, root)
+
+    steps = np.arange(num_steps).reshape(1, -1, 1)
+    pitches = scl[(values[:, np.newaxis, :] + steps * 2) % len(scl)]
+
+    # consecutive notes of the flattened melody: kept positions within a step, plus each step boundary
+    within = pitches[:, :, 1:] - pitches[:, :, :-1]
+    within_valid = np.broadcast_to(kept[:, np.newaxis, 1:], within.shape)
+    across = pitches[:, 1:, 0] - pitches[:, :-1, -1]
+    diffs = np.concatenate([within.reshape(num_genomes, -1), across], axis=1)
+    valid = np.concatenate([within_valid.reshape(num_genomes, -1), np.ones(across.shape, dtype=bool)], axis=1)
+
+    flat_pitches = pitches.reshape(num_genomes, -1)
+    pitch_range = flat_pitches.max(axis=1) - flat_pitches.min(axis=1)
+    contour_changes = (valid & (diffs != 0)).sum(axis=1)
+    note_repetition_penalty = (valid & (diffs == 0)).sum(axis=1)
+    # every pitch % len(SCALES) is a valid degree, so create_melody's conformance penalty is always zero
+    scale_conformance = 0
+
+    lengths = run_lengths(kept)
+    rhythmic_variety = count_distinct(lengths, lengths > 0, kept.shape[1] + 1)
+
+    # pitches are counted from the lowest one in the scale, which is negative for a negative root
+    lowest = int(scl.min())
+    span = int(scl.max()) - lowest + 1
+    contour_types = count_distinct(diffs // 2, valid, span + 1, offset=span // 2 + 1)
+    harmony_intervals = count_distinct(np.abs(diffs) % SCALE_DEGREES, valid, SCALE_DEGREES)
+    unique_pitches = count_distinct(flat_pitches, np.ones(flat_pitches.shape, dtype=bool), span, offset=-lowest)
+
+    # zip(notes, beat) pairs step s with the beat of entry s; steps are told apart by their scale shift
+    pattern_steps = min(num_steps, lengths.shape[1])
+    shifts = (np.arange(pattern_steps) * 2) % len(scl)
+    patterns = shifts * (lengths.shape[1] + 1) + lengths[:, :pattern_steps]
+    rhythmic_patterns = count_distinct(patterns, lengths[:, :pattern_steps] > 0, len(scl) * (lengths.shape[1] + 1))
+
+    diversity_score = contour_types + harmony_intervals + unique_pitches + rhythmic_patterns
+    fitness_scores = (pitch_range + contour_changes - note_repetition_penalty - scale_conformance + rhythmic_variety
+                      - diversity_score)
+    return fitness_scores.tolist()
@@ -0,0 +1,72 @@
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+TOKEN_DTYPE = np.int16
+
+
+def encode_notes(notes):
+    vocabulary = sorted(set(notes))
+    if len(vocabulary) > np.iinfo(TOKEN_DTYPE).max:
+        raise ValueError(f"Vocabulary of {len(vocabulary)} notes does not fit in {np.dtype(TOKEN_DTYPE).name}")
+    note_to_int = {note: number for number, note in enumerate(vocabulary)}
+    tokens = np.fromiter((note_to_int[note] for note in notes), dtype=TOKEN_DTYPE, count=len(notes))
+    return tokens, vocabulary
+
+
+def sort_vocabulary(ids, vocabulary):
+    # token store ids -> the encoding encode_notes gives the same notes: ids into the sorted vocabulary of
+    # the tokens that occur, without building the note strings
+    used = np.unique(ids).tolist()
+    order = sorted(used, key=vocabulary.__getitem__)
+    mapping = np.zeros(len(vocabulary), dtype=TOKEN_DTYPE)
+    mapping[order] = np.arange(len(order))
+    return mapping[ids], [vocabulary[i] for i in order]
+
+
+def index_paths(genre, index_dir):
+    return f'{index_dir}/{genre}.npy', f'{index_dir}/{genre}.vocab.json'
+
+
+def build_index(genre, notes_dir, index_dir):
+    with open(f'{notes_dir}/{genre}', 'rb') as filepath:
+        notes = pickle.load(filepath)
+    return save_index(genre, *encode_notes(notes), index_dir)
+
+
+def save_index(genre, tokens, vocabulary, index_dir):
+    tokens_path, vocabulary_path = index_paths(genre, index_dir)
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(tokens_path, tokens)
+    with open(vocabulary_path, 'w') as f:
+        json.dump(vocabulary, f)
+    return tokens_path, vocabulary_path
+
+
+def has_index(genre, index_dir):
+    return all(os.path.exists(path) for path in index_paths(genre, index_dir))
+
+
+def load_index(genre, index_dir):
+    tokens_path, vocabulary_path = index_paths(genre, index_dir)
+    tokens = np.load(tokens_path, mmap_mode='r')
+    with open(vocabulary_path) as f:
+        vocabulary = json.load(f)
+    return tokens, vocabulary
+
+
+def sequence_windows(tokens, sequence_length=100):
+    # zero-copy (N - sequence_length, sequence_length) view; the last window has no target note
+    return sliding_window_view(tokens, sequence_length)[:-1]
+
+
+if __name__ == "__main__":
+    from supervised.gen import GENRES, PATH
+
+    for genre in sys.argv[1:] or GENRES:
+        tokens_path, _ = build_index(genre, f'{PATH}/notes', f'{PATH}/notes_index')
+        print(f"Indexed {genre} -> {tokens_path}")
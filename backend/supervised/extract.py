@@ -0,0 +1,178 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from music21 import converter, instrument, note, chord
+
+from supervised.corpus_index import TOKEN_DTYPE, sort_vocabulary
+from supervised.gen import GENRES
+
+# the genre MIDI folders and everything extracted from them live next to this file, wherever it is run from
+PATH = os.path.dirname(os.path.abspath(__file__))
+# the vocabulary and manifest are rewritten whole, so they are saved every this many files and at the end
+DEFAULT_FLUSH_EVERY = 100
+
+logger = logging.getLogger(__name__)
+
+
+def extract_notes_from_midi(file_path):
+    midi = converter.parse(file_path)
+    parts = None
+
+    try:
+        parts = instrument.partitionByInstrument(midi).parts[0].recurse()
+    except:
+        parts = midi.flat.notes
+
+    notes = []
+    for element in parts:
+        if isinstance(element, note.Note):
+            notes.append(str(element.pitch))
+        elif isinstance(element, chord.Chord):
+            notes.append('.'.join(str(n) for n in element.normalOrder))
+
+    return notes
+
+
+def file_hash(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_file(file_path, content_hash):
+    return file_path, content_hash, extract_notes_from_midi(file_path)
+
+
+class TokenStore:
+    # Append-only store per genre: tokens.bin holds int16 ids, vocab.json the id -> token list
+    # (ids are never reassigned) and manifest.json maps a file's content hash to its token span.
+    def __init__(self, directory):
+        self.directory = directory
+        self.tokens_path = f'{directory}/tokens.bin'
+        self.vocabulary_path = f'{directory}/vocab.json'
+        self.manifest_path = f'{directory}/manifest.json'
+        os.makedirs(directory, exist_ok=True)
+        self.vocabulary = self._load_json(self.vocabulary_path, [])
+        self.manifest = self._load_json(self.manifest_path, {})
+        self.token_ids = {token: i for i, token in enumerate(self.vocabulary)}
+
+    def __contains__(self, content_hash):
+        return content_hash in self.manifest
+
+    def append(self, file_path, content_hash, notes):
+        for token in notes:
+            if token not in self.token_ids:
+                self.token_ids[token] = len(self.vocabulary)
+                self.vocabulary.append(token)
+        if len(self.vocabulary) > np.iinfo(TOKEN_DTYPE).max:
+            raise ValueError(f"Vocabulary of {len(self.vocabulary)} notes does not fit in int16")
+
+        ids = np.fromiter((self.token_ids[token] for token in notes), dtype=TOKEN_DTYPE, count=len(notes))
+        with open(self.tokens_path, 'ab') as f:
+            offset = f.tell() // ids.itemsize
+            f.write(ids.tobytes())
+        self.manifest[content_hash] = {'path': file_path, 'offset': offset, 'length': len(notes)}
+
+    def ids(self, content_hash):
+        # a memory-mapped view of one file's token ids
+        entry = self.manifest[content_hash]
+        if not entry['length']:
+            return np.empty(0, dtype=TOKEN_DTYPE)
+        return np.memmap(self.tokens_path, dtype=TOKEN_DTYPE, mode='r',
+                         offset=entry['offset'] * np.dtype(TOKEN_DTYPE).itemsize, shape=(entry['length'],))
+
+    def flush(self):
+        self._dump_json(self.vocabulary_path, self.vocabulary)
+        self._dump_json(self.manifest_path, self.manifest)
+
+    @staticmethod
+    def _load_json(path, default):
+        if not os.path.exists(path):
+            return default
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _dump_json(path, value):
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump(value, f)
+        os.replace(temporary_path, path)
+
+
+def extract_genre(genre, midi_dir, store_dir, processes=None, flush_every=DEFAULT_FLUSH_EVERY):
+    files = sorted(glob.glob(f'{midi_dir}/{genre}/*.mid'))
+    if not files:
+        raise FileNotFoundError(f"No MIDI files in {os.path.abspath(f'{midi_dir}/{genre}')}")
+    hashes = {file_path: file_hash(file_path) for file_path in files}
+    store = TokenStore(f'{store_dir}/{genre}')
+
+    pending = {content_hash: file_path for file_path, content_hash in hashes.items() if content_hash not in store}
+    logger.info("%s: %d files, %d unchanged, %d to parse", genre, len(files), len(files) - len(pending), len(pending))
+    if pending:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(extract_file, file_path, content_hash)
+                       for content_hash, file_path in pending.items()]
+            try:
+                for parsed, future in enumerate(as_completed(futures), 1):
+                    try:
+                        file_path, content_hash, notes = future.result()
+                    except Exception as e:
+                        logger.warning("Failed to parse MIDI file: %s", e)
+                        continue
+                    store.append(file_path, content_hash, notes)
+                    # flushed in batches, so an interrupted run keeps most of what it already parsed
+                    if parsed % flush_every == 0:
+                        store.flush()
+            finally:
+                store.flush()
+
+    # the corpus as (int16 tokens, sorted vocabulary), like encode_notes, read from the store's spans
+    spans = [store.ids(hashes[file_path]) for file_path in files if hashes[file_path] in store]
+    ids = np.concatenate(spans) if spans else np.empty(0, dtype=TOKEN_DTYPE)
+    return sort_vocabulary(ids, store.vocabulary)
+
+
+def save_notes(notes, file_path):
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    with open(file_path, 'wb') as filepath:
+        pickle.dump(notes, filepath)
+
+
+if __name__ == "__main__":
+    from supervised.corpus_index import save_index
+
+    parser = argparse.ArgumentParser(description="Extract note tokens from every genre's MIDI files")
+    parser.add_argument('genres', nargs='*', default=GENRES)
+    parser.add_argument('--midi-dir', default=PATH)
+    parser.add_argument('--store-dir', default=f'{PATH}/token_store')
+    parser.add_argument('--notes-dir', default=f'{PATH}/notes')
+    parser.add_argument('--index-dir', default=f'{PATH}/notes_index')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    failed = False
+    for genre in args.genres:
+        try:
+            tokens, vocabulary = extract_genre(genre, args.midi_dir, args.store_dir, args.processes)
+        except FileNotFoundError as e:
+            # an empty corpus would overwrite the genre's notes and index
+            logger.error("%s: %s", genre, e)
+            failed = True
+            continue
+        save_index(genre, tokens, vocabulary, args.index_dir)
+        # the pickled note strings are only written for the tools that still read them
+        save_notes([vocabulary[token] for token in tokens.tolist()], f'{args.notes_dir}/{genre}')
+        print(f"{genre}: {len(tokens)} notes")
+    sys.exit(1 if failed else 0)
@@ -1,10 +1,20 @@
+import logging
 import pickle
 import numpy as np
-from keras.models import Sequential
-from keras.layers import Dense, Dropout, LSTM, BatchNormalization as BatchNorm
-from music21 import instrument, note, stream, chord
+from metrics import metrics
+from supervised.corpus_index import encode_notes, has_index, load_index, sequence_windows
+from supervised.midi_writer import estimate_key, write_midi
+from supervised.incremental import create_incremental_model
+from supervised.numpy_lstm import NumpyLSTM
+from supervised.sampler import generate_batch, random_seeds
 
 PATH = 'E:/Last Semester/Licenta/licenta-repo/songwriter-copilot/backend/supervised'
+INDEX_PATH = f'{PATH}/notes_index'
+NUMPY_MODEL_PATH = f'{PATH}/numpy_models'
+GENRES = ["classical", "lofi", "poprock", "rock", "trap"]
+BACKENDS = ("keras", "numpy")
+
+logger = logging.getLogger(__name__)
 
 
 def load_notes(file_path):
@@ -37,6 +47,10 @@ def prepare_sequences(notes, unique_notes, sequence_length=100):
 
 
 def create_model(input_shape, num_unique_notes, genre):
+    # Keras is only imported once a model is needed, which keeps it out of the API's startup
+    from keras.models import Sequential
+    from keras.layers import Dense, Dropout, LSTM, BatchNormalization as BatchNorm
+
     model = Sequential()
     model.add(LSTM(512, input_shape=input_shape, recurrent_dropout=0.3, return_sequences=True))
     model.add(LSTM(512, return_sequences=True, recurrent_dropout=0.3))
@@ -53,70 +67,85 @@ def create_model(input_shape, num_unique_notes, genre):
     return model
 
 
-def generate_notes(model, input_sequences, unique_notes, num_unique_notes, num_generate=200):
-    int_to_note = {number: note for number, note in enumerate(unique_notes)}
-
-    start_index = np.random.randint(0, len(input_sequences) - 1)
-    pattern = input_sequences[start_index]
-    prediction_output = []
-
-    for _ in range(num_generate):
-        prediction_input = np.reshape(pattern, (1, len(pattern), 1))
-        prediction_input = prediction_input / float(num_unique_notes)
+def generate_notes(model, input_sequences, unique_notes, num_unique_notes, num_generate=200, int_to_note=None):
+    if int_to_note is None:
+        int_to_note = {number: note for number, note in enumerate(unique_notes)}
 
-        prediction = model.predict(prediction_input, verbose=0)
-        index = np.argmax(prediction)
-        result = int_to_note[index]
-        prediction_output.append(result)
+    seeds = random_seeds(input_sequences, 1)
+    return generate_batch(model, seeds, num_unique_notes, int_to_note, num_generate)[0]
 
-        pattern.append(index)
-        pattern = pattern[1:]
 
-    return prediction_output
+def render_midi(prediction_output):
+    with metrics.stage('midi_write'):
+        midi_bytes = write_midi(prediction_output)
+    with metrics.stage('key_analysis'):
+        key_signature_str = estimate_key(prediction_output)
+    logger.info("Key of the generated melody: %s", key_signature_str)
+    return midi_bytes, key_signature_str
 
 
 def create_midi(prediction_output, genre):
-    offset = 0
-    output_notes = []
     output_file = f'{genre}.mid'
+    midi_bytes, key_signature_str = render_midi(prediction_output)
 
-    for pattern in prediction_output:
-        if '.' in pattern or pattern.isdigit():
-            notes_in_chord = pattern.split('.')
-            chord_notes = [note.Note(int(n)) for n in notes_in_chord]
-            for n in chord_notes:
-                n.storedInstrument = instrument.Piano()
-            new_chord = chord.Chord(chord_notes)
-            new_chord.offset = offset
-            output_notes.append(new_chord)
-        else:
-            new_note = note.Note(pattern)
-            new_note.offset = offset
-            new_note.storedInstrument = instrument.Piano()
-            output_notes.append(new_note)
+    file_path = f"{PATH}/generated_music/{output_file}"
+    with open(file_path, 'wb') as f:
+        f.write(midi_bytes)
+    return file_path, key_signature_str
 
-        offset += 0.5
 
-    midi_stream = stream.Stream(output_notes)
-    key_signature = midi_stream.analyze('key')
-    key_signature_str = str(key_signature)
-    print(f"Key of the generated melody: {key_signature_str}")
+def load_corpus(genre):
+    if has_index(genre, INDEX_PATH):
+        return load_index(genre, INDEX_PATH)
+    return encode_notes(load_notes(f'{PATH}/notes/{genre}'))
 
-    file_path = f"{PATH}/generated_music/{output_file}"
-    midi_stream.write('midi', fp=file_path)
-    return file_path, key_signature_str
 
+def numpy_model_path(genre):
+    return f'{NUMPY_MODEL_PATH}/{genre}.npz'
 
-def generate_music(genre):
-    print("Generating music...")
-    notes = load_notes(f'{PATH}/notes/{genre}')
-    unique_notes = get_unique_notes(notes)
-    input_sequences, normalized_inputs, num_unique_notes = prepare_sequences(notes, unique_notes)
-    model = create_model((normalized_inputs.shape[1], normalized_inputs.shape[2]), num_unique_notes, genre)
-    prediction_output = generate_notes(model, input_sequences, unique_notes, num_unique_notes)
-    file_path, key_signature_str = create_midi(prediction_output, genre)
-    return file_path, key_signature_str
+
+def load_genre(genre, incremental=False, sequence_length=100, backend="keras", dequantize=False):
+    if genre not in GENRES:
+        raise ValueError(f"Unknown genre: {genre}")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    with metrics.stage('model_load', genre=genre, backend=backend):
+        tokens, unique_notes = load_corpus(genre)
+        num_unique_notes = len(unique_notes)
+        if backend == "numpy":
+            # exported by supervised/numpy_lstm.py; no Keras or TensorFlow import on this path
+            model = NumpyLSTM.load(numpy_model_path(genre), dequantize=dequantize)
+        else:
+            model = create_model((sequence_length, 1), num_unique_notes, genre)
+    metrics.inc('model_loads_total', genre=genre, backend=backend)
+    bundle = {
+        "genre": genre,
+        "model": model,
+        "unique_notes": unique_notes,
+        "num_unique_notes": num_unique_notes,
+        "note_to_int": {note: number for number, note in enumerate(unique_notes)},
+        "int_to_note": {number: note for number, note in enumerate(unique_notes)},
+        "tokens": tokens,
+        "input_sequences": sequence_windows(tokens, sequence_length),
+    }
+    if incremental:
+        bundle["incremental_model"] = model.incremental() if backend == "numpy" else create_incremental_model(model)
+    return bundle
+
+
+def generate_music(genre, registry=None, batcher=None):
+    logger.info("Generating %s music", genre)
+    metrics.inc('melodies_generated_total', genre=genre)
+    if batcher is not None:
+        prediction_output = batcher.generate(genre)
+    else:
+        bundle = registry.get(genre) if registry is not None else load_genre(genre)
+        prediction_output = generate_notes(bundle["model"], bundle["input_sequences"], bundle["unique_notes"],
+                                           bundle["num_unique_notes"], int_to_note=bundle["int_to_note"])
+    return render_midi(prediction_output)
 
 
 if __name__ == "__main__":
-    file_path, key_signature = generate_music('classical')
+    midi_bytes, key_signature = generate_music('classical')
+    with open(f"{PATH}/generated_music/classical.mid", 'wb') as f:
+        f.write(midi_bytes)
@@ -0,0 +1,123 @@
+import io
+import sys
+
+import numpy as np
+from midiutil import MIDIFile
+
+STEP_PITCH_CLASSES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+ACCIDENTAL_ALTERS = {'#': 1, '-': -1}
+# chord tokens hold bare pitch classes, which music21 places in octave 4
+CHORD_BASE_MIDI = 60
+DEFAULT_OCTAVE = 4
+NOTE_STEP = 0.5
+NOTE_DURATION = 1.0
+NOTE_VELOCITY = 90
+PIANO_PROGRAM = 0
+DEFAULT_BPM = 120
+
+# Aarden-Essen weights, the profile behind music21's analyze('key')
+MAJOR_PROFILE = [17.7661, 0.145624, 14.9265, 0.160186, 19.8049, 11.3587,
+                 0.291248, 22.062, 0.145624, 8.15494, 0.232998, 4.95122]
+MINOR_PROFILE = [18.2648, 0.737619, 14.0499, 16.8599, 0.702494, 14.4362,
+                 0.702494, 18.6161, 4.56621, 1.93186, 7.37619, 1.75623]
+MAJOR_TONICS = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'A-', 'A', 'B-', 'B']
+MINOR_TONICS = ['c', 'c#', 'd', 'e-', 'e', 'f', 'f#', 'g', 'g#', 'a', 'b-', 'b']
+KEY_NAMES = [f'{tonic} major' for tonic in MAJOR_TONICS] + [f'{tonic} minor' for tonic in MINOR_TONICS]
+
+
+def rotated_profiles(profile):
+    profile = np.asarray(profile, dtype=np.float64)
+    # row i is the profile with its tonic on pitch class i
+    rotations = np.array([np.roll(profile, tonic) for tonic in range(12)])
+    return rotations - profile.mean()
+
+
+KEY_PROFILES = np.vstack([rotated_profiles(MAJOR_PROFILE), rotated_profiles(MINOR_PROFILE)])
+KEY_PROFILE_NORMS = np.sqrt((KEY_PROFILES ** 2).sum(axis=1))
+
+
+def note_name_to_midi(name):
+    pitch_class = STEP_PITCH_CLASSES[name[0].upper()]
+    i = 1
+    while i < len(name) and name[i] in ACCIDENTAL_ALTERS:
+        pitch_class += ACCIDENTAL_ALTERS[name[i]]
+        i += 1
+    octave = int(name[i:]) if i < len(name) else DEFAULT_OCTAVE
+    return (octave + 1) * 12 + pitch_class
+
+
+def token_pitches(token):
+    if '.' in token or token.isdigit():
+        return [CHORD_BASE_MIDI + int(n) for n in token.split('.')]
+    return [note_name_to_midi(token)]
+
+
+def pitch_class_histogram(prediction_output):
+    histogram = np.zeros(12, dtype=np.float64)
+    for token in prediction_output:
+        for pitch in token_pitches(token):
+            histogram[pitch % 12] += NOTE_DURATION
+    return histogram
+
+
+def estimate_key(prediction_output):
+    histogram = pitch_class_histogram(prediction_output)
+    centered = histogram - histogram.mean()
+    norm = np.sqrt((centered ** 2).sum())
+    if norm == 0:
+        return KEY_NAMES[0]
+    correlations = KEY_PROFILES.dot(centered) / (KEY_PROFILE_NORMS * norm)
+    return KEY_NAMES[int(np.argmax(correlations))]
+
+
+def write_midi(prediction_output, bpm=DEFAULT_BPM):
+    mf = MIDIFile(1)
+    track = 0
+    channel = 0
+    mf.addTempo(track, 0, bpm)
+    mf.addProgramChange(track, channel, 0, PIANO_PROGRAM)
+
+    offset = 0.0
+    for token in prediction_output:
+        for pitch in token_pitches(token):
+            mf.addNote(track, channel, pitch, offset, NOTE_DURATION, NOTE_VELOCITY)
+        offset += NOTE_STEP
+
+    buffer = io.BytesIO()
+    mf.writeFile(buffer)
+    return buffer.getvalue()
+
+
+def check_key_parity(token_sequences):
+    # offline check against music21, which is only imported here
+    from music21 import chord, note, stream
+
+    mismatches = []
+    for tokens in token_sequences:
+        elements = []
+        for offset, token in enumerate(tokens):
+            if '.' in token or token.isdigit():
+                element = chord.Chord([note.Note(int(n)) for n in token.split('.')])
+            else:
+                element = note.Note(token)
+            element.offset = offset * NOTE_STEP
+            elements.append(element)
+        expected = str(stream.Stream(elements).analyze('key'))
+        estimated = estimate_key(tokens)
+        if expected != estimated:
+            mismatches.append((expected, estimated))
+    return mismatches
+
+
+if __name__ == "__main__":
+    import pickle
+
+    from supervised.gen import GENRES, PATH
+
+    rng = np.random.default_rng(0)
+    for genre in sys.argv[1:] or GENRES:
+        with open(f'{PATH}/notes/{genre}', 'rb') as filepath:
+            notes = pickle.load(filepath)
+        starts = rng.integers(0, len(notes) - 200, size=50)
+        mismatches = check_key_parity([notes[start:start + 200] for start in starts])
+        print(f"{genre}: {len(mismatches)} / {len(starts)} mismatches {mismatches}")
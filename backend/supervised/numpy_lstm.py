@@ -0,0 +1,250 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import zipfile
+
+import numpy as np
+
+QUANTIZED_DTYPES = ('float32', 'float16', 'int8')
+INT8_MAX = np.iinfo(np.int8).max
+# size of the fixed part of a zip local file header, before the file name and extra field
+ZIP_LOCAL_HEADER = 30
+
+
+def sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1)
+
+
+def quantize(matrix, dtype):
+    # int8 uses one symmetric scale per output column; float16 and float32 are stored as they are
+    if dtype == 'int8':
+        scale = np.abs(matrix).max(axis=0) / INT8_MAX
+        scale[scale == 0] = 1
+        return np.round(matrix / scale).astype(np.int8), scale.astype(np.float32)
+    return matrix.astype(dtype), None
+
+
+def fold_batch_norm(gamma, beta, mean, variance, epsilon, kernel, bias):
+    # BatchNorm(x) @ kernel + bias == x @ (scale[:, None] * kernel) + (shift @ kernel + bias)
+    scale = gamma / np.sqrt(variance + epsilon)
+    shift = beta - mean * scale
+    return scale[:, np.newaxis] * kernel, shift @ kernel + bias
+
+
+def extract_weights(model):
+    # Reads the trained stack (LSTMs, then BatchNorm/Dense pairs with Dropout in between) into plain arrays,
+    # with every BatchNorm folded into the Dense layer after it. Dropout is the identity at inference.
+    lstms = []
+    denses = []
+    pending_norm = None
+    for layer in model.layers:
+        kind = type(layer).__name__
+        weights = [np.asarray(weight, dtype=np.float64) for weight in layer.get_weights()]
+        if kind == 'LSTM':
+            lstms.append(weights)
+        elif kind == 'BatchNormalization':
+            pending_norm = weights + [layer.epsilon]
+        elif kind == 'Dense':
+            kernel, bias = weights
+            if pending_norm is not None:
+                kernel, bias = fold_batch_norm(*pending_norm, kernel, bias)
+                pending_norm = None
+            denses.append((kernel, bias, layer.get_config()['activation']))
+        elif kind != 'Dropout':
+            raise ValueError(f"Unsupported layer for the NumPy backend: {kind}")
+    if pending_norm is not None:
+        raise ValueError("BatchNormalization must be followed by a Dense layer")
+    return lstms, denses
+
+
+def export_model(model, path, dtype='float16'):
+    if dtype not in QUANTIZED_DTYPES:
+        raise ValueError(f"Unknown dtype: {dtype}")
+    lstms, denses = extract_weights(model)
+    arrays = {}
+
+    def add_matrix(name, matrix):
+        arrays[name], scale = quantize(matrix, dtype)
+        if scale is not None:
+            arrays[f'{name}_scale'] = scale
+
+    for i, (kernel, recurrent, bias) in enumerate(lstms):
+        add_matrix(f'lstm{i}_kernel', kernel)
+        add_matrix(f'lstm{i}_recurrent', recurrent)
+        arrays[f'lstm{i}_bias'] = bias.astype(np.float32)
+    for i, (kernel, bias, _) in enumerate(denses):
+        add_matrix(f'dense{i}_kernel', kernel)
+        arrays[f'dense{i}_bias'] = bias.astype(np.float32)
+
+    meta = {'dtype': dtype, 'lstm_layers': len(lstms), 'activations': [activation for *_, activation in denses]}
+    # stored, not compressed, so every array can be memory-mapped straight out of the archive
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+    return path
+
+
+def load_npz_mmap(path):
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} is compressed and cannot be memory-mapped")
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack('<HH', f.read(ZIP_LOCAL_HEADER)[26:])
+            f.seek(info.header_offset + ZIP_LOCAL_HEADER + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            if dtype.hasobject:
+                raise ValueError(f"{path} holds an object array: {name}")
+            if not shape or not all(shape):
+                # scalars and empty arrays cannot be mapped and are small enough to read
+                count = int(np.prod(shape))
+                arrays[name] = np.frombuffer(f.read(count * dtype.itemsize), dtype=dtype).reshape(shape)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+
+class NumpyLSTM:
+    # Forward pass of the exported network. predict_on_batch takes the same (batch, steps, 1) windows as the
+    # Keras model and returns the pre-softmax scores, which have the same argmax as the probabilities.
+    def __init__(self, arrays, dequantize=False):
+        meta = json.loads(str(arrays['meta']))
+        self.dtype = meta['dtype']
+        self.activations = meta['activations']
+        self._arrays = arrays
+        self._matrices = {}
+        for name, matrix in arrays.items():
+            if name.endswith('_kernel') or name.endswith('_recurrent'):
+                scale = arrays.get(f'{name}_scale')
+                if dequantize:
+                    # trades the shared mapping for a private float32 copy that skips the per-step cast
+                    matrix = np.asarray(matrix, dtype=np.float32) * (scale if scale is not None else 1)
+                    scale = None
+                self._matrices[name] = (matrix, scale)
+        self.lstm_layers = [(f'lstm{i}_kernel', f'lstm{i}_recurrent', arrays[f'lstm{i}_bias'])
+                            for i in range(meta['lstm_layers'])]
+        self.dense_layers = [(f'dense{i}_kernel', arrays[f'dense{i}_bias'], activation)
+                             for i, activation in enumerate(self.activations)]
+        # an (h, c) pair per LSTM layer
+        self.state_sizes = [self._matrices[recurrent][0].shape[0] for _, recurrent, _ in self.lstm_layers
+                            for _ in range(2)]
+
+    @classmethod
+    def load(cls, path, dequantize=False):
+        return cls(load_npz_mmap(path), dequantize=dequantize)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self._arrays.values())
+
+    def count_params(self):
+        return sum(array.size for name, array in self._arrays.items() if name != 'meta' and
+                   not name.endswith('_scale'))
+
+    def _float32(self, name):
+        # float16 and int8 weights are cast once per call rather than once per timestep
+        matrix, scale = self._matrices[name]
+        return (matrix if matrix.dtype == np.float32 else matrix.astype(np.float32)), scale
+
+    def _matmul(self, x, name):
+        matrix, scale = self._float32(name)
+        product = x @ matrix
+        return product * scale if scale is not None else product
+
+    def _lstm(self, layer, inputs, h, c):
+        # Keras gate order is input, forget, cell, output; the input projection of all steps is one matmul
+        kernel, recurrent, bias = layer
+        batch_size, steps, _ = inputs.shape
+        projected = self._matmul(inputs.reshape(batch_size * steps, -1), kernel).reshape(batch_size, steps, -1)
+        projected += bias
+        recurrent, recurrent_scale = self._float32(recurrent)
+        outputs = np.empty((batch_size, steps, h.shape[1]), dtype=np.float32)
+        for step in range(steps):
+            recurrent_gates = h @ recurrent
+            if recurrent_scale is not None:
+                recurrent_gates *= recurrent_scale
+            gates = projected[:, step] + recurrent_gates
+            i, f, g, o = np.split(gates, 4, axis=1)
+            c = sigmoid(f) * c + sigmoid(i) * np.tanh(g)
+            h = sigmoid(o) * np.tanh(c)
+            outputs[:, step] = h
+        return outputs, h, c
+
+    def _head(self, x):
+        for kernel, bias, activation in self.dense_layers:
+            x = self._matmul(x, kernel) + bias
+            if activation == 'relu':
+                x = np.maximum(x, 0)
+            elif activation not in ('softmax', 'linear'):
+                raise ValueError(f"Unsupported activation for the NumPy backend: {activation}")
+        return x
+
+    def run(self, inputs, states):
+        x = np.asarray(inputs, dtype=np.float32)
+        next_states = []
+        for layer, h, c in zip(self.lstm_layers, states[::2], states[1::2]):
+            x, h, c = self._lstm(layer, x, h, c)
+            next_states.extend([h, c])
+        return self._head(x[:, -1]), next_states
+
+    def initial_states(self, batch_size):
+        return [np.zeros((batch_size, size), dtype=np.float32) for size in self.state_sizes]
+
+    def predict_on_batch(self, window):
+        return self.run(window, self.initial_states(len(window)))[0]
+
+    def incremental(self):
+        return NumpyIncrementalLSTM(self)
+
+
+class NumpyIncrementalLSTM:
+    # the [sequence] + states -> [scores] + states protocol of create_incremental_model's Keras model
+    def __init__(self, model):
+        self.model = model
+        self.state_sizes = model.state_sizes
+
+    def predict_on_batch(self, inputs):
+        scores, states = self.model.run(inputs[0], inputs[1:])
+        return [scores] + states
+
+    def count_params(self):
+        # shares every weight with the windowed model
+        return 0
+
+
+def check_numpy_parity(model, numpy_model, windows):
+    # argmax of the exported network against the Keras model on the same windows
+    expected = np.argmax(model.predict_on_batch(windows), axis=1)
+    actual = np.argmax(numpy_model.predict_on_batch(windows), axis=1)
+    return float(np.mean(expected == actual))
+
+
+if __name__ == "__main__":
+    from supervised.gen import GENRES, load_genre, numpy_model_path
+
+    parser = argparse.ArgumentParser(description="Export the trained genre models for the NumPy backend")
+    parser.add_argument('genres', nargs='*', default=GENRES)
+    parser.add_argument('--dtype', choices=QUANTIZED_DTYPES, default='float16')
+    parser.add_argument('--windows', type=int, default=64, help="corpus windows used for the argmax check")
+    parser.add_argument('--min-agreement', type=float, default=1.0)
+    args = parser.parse_args()
+
+    failed = False
+    for genre in args.genres:
+        bundle = load_genre(genre)
+        path = export_model(bundle["model"], numpy_model_path(genre), args.dtype)
+        windows = np.asarray(bundle["input_sequences"][::max(1, len(bundle["input_sequences"]) // args.windows)])
+        windows = (windows[:args.windows] / float(bundle["num_unique_notes"])).astype(np.float32)[:, :, np.newaxis]
+        agreement = check_numpy_parity(bundle["model"], NumpyLSTM.load(path), windows)
+        print(f"Exported {genre} -> {path} ({args.dtype}), argmax agreement {agreement:.3f}")
+        failed = failed or agreement < args.min_agreement
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+
+DEFAULT_DEPTH = 4
+DEFAULT_REFILL_INTERVAL = 0.5
+DEFAULT_ERROR_BACKOFF = 30
+
+logger = logging.getLogger(__name__)
+
+
+class PregenPool:
+    # Keeps up to `depth` finished melodies per genre, so a request only pops a deque. A background thread
+    # refills the buffers, at most one melody every refill_interval seconds and only while no request is
+    # generating synchronously, so the model is never shared between a waiting user and the refill. With
+    # `loaded`, a callable returning the genres whose models are in memory, only those genres are refilled,
+    # so refills never load a model and evict one that live requests are using.
+    def __init__(self, generate, genres, depth=DEFAULT_DEPTH, refill_interval=DEFAULT_REFILL_INTERVAL,
+                 error_backoff=DEFAULT_ERROR_BACKOFF, loaded=None):
+        self.generate = generate
+        self.loaded = loaded
+        self.depth = depth
+        self.refill_interval = refill_interval
+        self.error_backoff = error_backoff
+        self._buffers = {genre: deque(maxlen=depth) for genre in genres}
+        self._hits = dict.fromkeys(self._buffers, 0)
+        self._misses = dict.fromkeys(self._buffers, 0)
+        self._refills = dict.fromkeys(self._buffers, 0)
+        self._failed_until = dict.fromkeys(self._buffers, 0.0)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        if self._buffers and self.depth > 0:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='pregen')
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        with self._wake:
+            self._stopped = True
+            self._wake.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def take(self, genre):
+        buffer = self._buffers.get(genre)
+        if buffer:
+            try:
+                item = buffer.popleft()
+            except IndexError:
+                # another request emptied it in between
+                pass
+            else:
+                with self._wake:
+                    self._hits[genre] += 1
+                    self._wake.notify()
+                metrics.inc('pregen_hits_total', genre=genre)
+                return item
+
+        with self._lock:
+            if genre in self._misses:
+                self._misses[genre] += 1
+            self._active += 1
+        metrics.inc('pregen_misses_total', genre=genre)
+        try:
+            return self.generate(genre)
+        finally:
+            with self._wake:
+                self._active -= 1
+                self._wake.notify()
+
+    def stats(self):
+        with self._lock:
+            return {
+                genre: {
+                    'buffered': len(buffer),
+                    'depth': self.depth,
+                    'hits': self._hits[genre],
+                    'misses': self._misses[genre],
+                    'refills': self._refills[genre],
+                    'hit_ratio': self._hits[genre] / ((self._hits[genre] + self._misses[genre]) or 1),
+                }
+                for genre, buffer in self._buffers.items()
+            }
+
+    def _next_genre(self, now):
+        # the emptiest buffer first, skipping genres whose last refill failed recently
+        loaded = set(self.loaded()) if self.loaded is not None else self._buffers
+        candidates = [(len(buffer), genre) for genre, buffer in self._buffers.items()
+                      if len(buffer) < self.depth and self._failed_until[genre] <= now and genre in loaded]
+        return min(candidates)[1] if candidates else None
+
+    def _run(self):
+        next_refill = 0.0
+        while True:
+            with self._wake:
+                while True:
+                    if self._stopped:
+                        return
+                    now = time.monotonic()
+                    # rate limited, so a burst of pops does not turn into back-to-back generation
+                    genre = self._next_genre(now) if not self._active and now >= next_refill else None
+                    if genre is not None:
+                        break
+                    self._wake.wait(next_refill - now if now < next_refill else self.refill_interval)
+
+            next_refill = time.monotonic() + self.refill_interval
+            try:
+                with metrics.stage('pregen_refill', genre=genre):
+                    item = self.generate(genre)
+            except Exception as e:
+                logger.warning("Pre-generating %s failed: %s", genre, e)
+                metrics.inc('pregen_errors_total', genre=genre)
+                with self._lock:
+                    self._failed_until[genre] = time.monotonic() + self.error_backoff
+                continue
+
+            with self._lock:
+                self._buffers[genre].append(item)
+                self._refills[genre] += 1
+            metrics.inc('pregen_refills_total', genre=genre)
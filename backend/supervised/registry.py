@@ -0,0 +1,98 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from metrics import metrics
+from supervised.gen import GENRES, load_genre
+
+BYTES_PER_PARAM = 4
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_model_bytes(model):
+    # NumPy models know their (possibly quantized) size; Keras weights are float32
+    return getattr(model, 'nbytes', None) or model.count_params() * BYTES_PER_PARAM
+
+
+def estimate_bundle_bytes(bundle):
+    model_bytes = estimate_model_bytes(bundle["model"])
+    if "incremental_model" in bundle:
+        model_bytes += estimate_model_bytes(bundle["incremental_model"])
+    # input_sequences is a strided view over the tokens, so the tokens are all there is to count
+    return model_bytes + bundle["tokens"].nbytes
+
+
+class ModelRegistry:
+    def __init__(self, loader=load_genre, max_models=None, max_bytes=None, sizer=estimate_bundle_bytes):
+        self.loader = loader
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self._bundles = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._load_locks = {genre: threading.Lock() for genre in GENRES}
+
+    def get(self, genre):
+        if genre not in self._load_locks:
+            raise ValueError(f"Unknown genre: {genre}")
+
+        with self._lock:
+            bundle = self._bundles.get(genre)
+            if bundle is not None:
+                self._bundles.move_to_end(genre)
+                return bundle
+
+        # one loader per genre; concurrent callers wait for it instead of loading a copy each
+        with self._load_locks[genre]:
+            with self._lock:
+                bundle = self._bundles.get(genre)
+                if bundle is not None:
+                    self._bundles.move_to_end(genre)
+                    return bundle
+
+            bundle = self.loader(genre)
+            size = self.sizer(bundle)
+
+            with self._lock:
+                self._bundles[genre] = bundle
+                self._sizes[genre] = size
+                self._evict()
+            return bundle
+
+    def warm_up(self, genres=GENRES):
+        for genre in genres:
+            self.get(genre)
+
+    def evict(self, genre):
+        with self._lock:
+            self._sizes.pop(genre, None)
+            return self._bundles.pop(genre, None) is not None
+
+    def can_hold(self, count):
+        # whether `count` genres stay loaded together; a byte budget depends on the models, so it never does
+        return self.max_bytes is None and (self.max_models is None or self.max_models >= count)
+
+    def loaded(self):
+        with self._lock:
+            return list(self._bundles)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def _evict(self):
+        # the most recently used genre always stays, even if it alone exceeds the budget
+        while len(self._bundles) > 1 and self._over_budget():
+            genre, _ = self._bundles.popitem(last=False)
+            self._sizes.pop(genre, None)
+            metrics.inc('model_evictions_total', genre=genre)
+            logger.info("Evicted %s model from registry", genre)
+
+    def _over_budget(self):
+        if self.max_models is not None and len(self._bundles) > self.max_models:
+            return True
+        if self.max_bytes is not None and sum(self._sizes.values()) > self.max_bytes:
+            return True
+        return False
@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import metrics
+from supervised.incremental import generate_batch_incremental
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT = 0.02
+
+
+def random_seeds(input_sequences, count):
+    start_indices = np.random.randint(0, len(input_sequences) - 1, size=count)
+    return np.array([input_sequences[i][:] for i in start_indices], dtype=np.int64)
+
+
+def generate_batch(model, seeds, num_unique_notes, int_to_note, num_generate=200):
+    seeds = np.asarray(seeds)
+    batch_size, sequence_length = seeds.shape
+
+    # normalized once; each step shifts the window left in place and writes the new note at the end
+    window = np.empty((batch_size, sequence_length, 1), dtype=np.float32)
+    window[:, :, 0] = seeds / float(num_unique_notes)
+    indices = np.empty((batch_size, num_generate), dtype=np.int64)
+
+    with metrics.stage('predict', mode='window'):
+        for step in range(num_generate):
+            prediction = model.predict_on_batch(window)
+            index = np.argmax(prediction, axis=1)
+            indices[:, step] = index
+            window[:, :-1] = window[:, 1:]
+            window[:, -1, 0] = index / float(num_unique_notes)
+    metrics.inc('notes_generated_total', batch_size * num_generate)
+
+    return [[int_to_note[i] for i in row] for row in indices.tolist()]
+
+
+class MicroBatcher:
+    def __init__(self, registry, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT,
+                 num_generate=200, incremental=False, reprime_every=None):
+        self.registry = registry
+        self.incremental = incremental
+        self.reprime_every = reprime_every
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.num_generate = num_generate
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, genre):
+        future = Future()
+        self._queue_for(genre).put(future)
+        return future
+
+    def generate(self, genre, timeout=None):
+        return self.submit(genre).result(timeout)
+
+    def _queue_for(self, genre):
+        with self._lock:
+            pending = self._queues.get(genre)
+            if pending is None:
+                pending = self._queues[genre] = queue.Queue()
+                worker = threading.Thread(target=self._run, args=(genre, pending), daemon=True,
+                                          name=f"sampler-{genre}")
+                worker.start()
+            return pending
+
+    def _collect(self, pending):
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [future for future in batch if future.set_running_or_notify_cancel()]
+
+    def _run(self, genre, pending):
+        while True:
+            batch = self._collect(pending)
+            if not batch:
+                continue
+            metrics.inc('sampler_batches_total', genre=genre)
+            metrics.inc('sampler_requests_total', len(batch), genre=genre)
+            try:
+                bundle = self.registry.get(genre)
+                seeds = random_seeds(bundle["input_sequences"], len(batch))
+                if self.incremental:
+                    melodies = generate_batch_incremental(bundle["incremental_model"], seeds,
+                                                          bundle["num_unique_notes"], bundle["int_to_note"],
+                                                          self.num_generate, self.reprime_every)
+                else:
+                    melodies = generate_batch(bundle["model"], seeds, bundle["num_unique_notes"],
+                                              bundle["int_to_note"], self.num_generate)
+            except Exception as e:
+                for future in batch:
+                    future.set_exception(e)
+            else:
+                for future, melody in zip(batch, melodies):
+                    future.set_result(melody)
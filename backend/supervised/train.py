@@ -1,68 +1,72 @@
-import glob
-import pickle
+import sys
+import time
+
 import numpy as np
-from music21 import converter, instrument, note, chord
+import tensorflow as tf
 from keras.models import Sequential
 from keras.layers import Dense, Dropout, LSTM, BatchNormalization as BatchNorm
-from keras.utils import np_utils
-from keras.callbacks import ModelCheckpoint
+from keras.utils import to_categorical
+from keras.callbacks import Callback, ModelCheckpoint
+from supervised.corpus_index import load_index, save_index, sequence_windows
+from supervised.extract import PATH, extract_genre
+from supervised.gen import INDEX_PATH
 
+DEFAULT_SHUFFLE_BUFFER = 10000
 
-def extract_notes_from_midi(file_path):
-    midi = converter.parse(file_path)
-    parts = None
 
-    try:
-        parts = instrument.partitionByInstrument(midi).parts[0].recurse()
-    except:
-        parts = midi.flat.notes
+def get_tokens(genre='classical'):
+    # extracts whatever changed into the token store, then trains on the memory-mapped int16 index that
+    # generation reads too, so both use the same vocabulary; no note strings are built
+    tokens, vocabulary = extract_genre(genre, PATH, f'{PATH}/token_store')
+    save_index(genre, tokens, vocabulary, INDEX_PATH)
+    return load_index(genre, INDEX_PATH)
 
-    notes = []
-    for element in parts:
-        if isinstance(element, note.Note):
-            notes.append(str(element.pitch))
-        elif isinstance(element, chord.Chord):
-            notes.append('.'.join(str(n) for n in element.normalOrder))
 
-    return notes
+def prepare_sequences(tokens, num_unique_notes, sequence_length=100):
+    windows = sequence_windows(tokens, sequence_length)
+    normalized_inputs = (windows / float(num_unique_notes))[:, :, np.newaxis]
+    categorical_outputs = to_categorical(tokens[sequence_length:], num_unique_notes)
 
+    return normalized_inputs, categorical_outputs, num_unique_notes
 
-def save_notes(notes, file_path):
-    with open(file_path, 'wb') as filepath:
-        pickle.dump(notes, filepath)
 
+def make_dataset(tokens, num_unique_notes, sequence_length=100, batch_size=128, shuffle_buffer=DEFAULT_SHUFFLE_BUFFER,
+                 seed=None):
+    # windows are sliced lazily from the int16 corpus, so no (windows, sequence_length) array is built and
+    # the corpus itself takes two bytes a note
+    corpus = tf.constant(np.asarray(tokens, dtype=np.int16))
+    num_windows = len(tokens) - sequence_length
 
-def get_notes():
-    notes = []
-    for file in glob.glob("classical/*.mid"):
-        notes.extend(extract_notes_from_midi(file))
-    save_notes(notes, './classical_model/notes')
-    return notes
+    def window(i):
+        inputs = tf.cast(corpus[i:i + sequence_length], tf.float32) / float(num_unique_notes)
+        target = tf.cast(corpus[i + sequence_length], tf.int32)
+        return tf.expand_dims(inputs, -1), target
 
+    dataset = tf.data.Dataset.range(num_windows)
+    dataset = dataset.shuffle(min(shuffle_buffer, num_windows), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.map(window, num_parallel_calls=tf.data.AUTOTUNE)
+    dataset = dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    return dataset, num_windows
 
-def prepare_sequences(notes, sequence_length=100):
-    unique_notes = sorted(set(notes))
-    note_to_int = {note: number for number, note in enumerate(unique_notes)}
-    num_unique_notes = len(unique_notes)
 
-    input_sequences = []
-    output_notes = []
+class ThroughputLogger(Callback):
+    def __init__(self, samples_per_epoch):
+        super().__init__()
+        self.samples_per_epoch = samples_per_epoch
+        self.epoch_start = None
 
-    for i in range(len(notes) - sequence_length):
-        input_seq = notes[i:i + sequence_length]
-        output_note = notes[i + sequence_length]
-        input_sequences.append([note_to_int[note] for note in input_seq])
-        output_notes.append(note_to_int[output_note])
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_start = time.perf_counter()
 
-    num_patterns = len(input_sequences)
-    normalized_inputs = (np.reshape(input_sequences,
-                                    (num_patterns, sequence_length, 1)) / float(num_unique_notes))
-    categorical_outputs = np_utils.to_categorical(output_notes)
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self.epoch_start
+        throughput = self.samples_per_epoch / elapsed
+        if logs is not None:
+            logs['samples_per_second'] = throughput
+        print(f"Epoch {epoch + 1}: {self.samples_per_epoch} samples in {elapsed:.1f}s ({throughput:.0f} samples/s)")
 
-    return normalized_inputs, categorical_outputs, num_unique_notes
 
-
-def create_model(input_shape, num_unique_notes, weights_file=None):
+def create_model(input_shape, num_unique_notes, weights_file=None, loss='categorical_crossentropy'):
     model = Sequential([
         LSTM(512, input_shape=input_shape, recurrent_dropout=0.3, return_sequences=True),
         LSTM(512, return_sequences=True, recurrent_dropout=0.3),
@@ -74,7 +78,7 @@ def create_model(input_shape, num_unique_notes, weights_file=None):
         Dropout(0.3),
         Dense(num_unique_notes, activation='softmax')
     ])
-    model.compile(loss='categorical_crossentropy', optimizer='rmsprop')
+    model.compile(loss=loss, optimizer='rmsprop')
 
     if weights_file:
         model.load_weights(weights_file)
@@ -82,21 +86,38 @@ def create_model(input_shape, num_unique_notes, weights_file=None):
     return model
 
 
-def train_model(model, inputs, outputs, epochs=200, batch_size=128):
-    checkpoint = ModelCheckpoint(
-        "classical/weights-improvement-{epoch:02d}.hdf5",
+def checkpoint_callback(genre):
+    return ModelCheckpoint(
+        f"{PATH}/{genre}/weights-improvement-{{epoch:02d}}.weights.h5",
         monitor='loss',
+        save_weights_only=True,
         save_best_only=True,
         mode='min'
     )
-    model.fit(inputs, outputs, epochs=epochs, batch_size=batch_size, callbacks=[checkpoint])
 
 
-def train_network():
-    notes = get_notes()
-    inputs, outputs, num_unique_notes = prepare_sequences(notes)
-    model = create_model((inputs.shape[1], inputs.shape[2]), num_unique_notes)
-    train_model(model, inputs, outputs)
+def train_model(model, inputs, outputs, epochs=200, batch_size=128, genre='classical'):
+    callbacks = [checkpoint_callback(genre), ThroughputLogger(len(inputs))]
+    model.fit(inputs, outputs, epochs=epochs, batch_size=batch_size, callbacks=callbacks)
+
+
+def train_model_streaming(model, dataset, num_windows, epochs=200, genre='classical'):
+    model.fit(dataset, epochs=epochs, callbacks=[checkpoint_callback(genre), ThroughputLogger(num_windows)])
+
+
+def train_network(genre='classical', streaming=True, batch_size=128, shuffle_buffer=DEFAULT_SHUFFLE_BUFFER,
+                  sequence_length=100):
+    tokens, vocabulary = get_tokens(genre)
+    if not streaming:
+        inputs, outputs, num_unique_notes = prepare_sequences(tokens, len(vocabulary), sequence_length)
+        model = create_model((inputs.shape[1], inputs.shape[2]), num_unique_notes)
+        train_model(model, inputs, outputs, batch_size=batch_size, genre=genre)
+        return
+
+    dataset, num_windows = make_dataset(tokens, len(vocabulary), sequence_length, batch_size, shuffle_buffer)
+    model = create_model((sequence_length, 1), len(vocabulary), loss='sparse_categorical_crossentropy')
+    train_model_streaming(model, dataset, num_windows, genre=genre)
 
 
-train_network()
+if __name__ == "__main__":
+    train_network(*sys.argv[1:2])
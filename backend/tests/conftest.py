@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the backend modules import each other from the backend folder, as when the API is run from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,8 @@
+from benchmarks.import_time import heavy_imports, measure_import
+
+
+def test_api_import_skips_keras_and_tensorflow():
+    # python -X importtime -c "import api" in a fresh interpreter
+    heavy = heavy_imports(measure_import('api'))
+    assert 'keras' not in heavy
+    assert 'tensorflow' not in heavy
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+keras = pytest.importorskip('keras')
+
+from supervised.incremental import check_incremental_parity  # noqa: E402
+
+NUM_UNIQUE_NOTES = 12
+SEQUENCE_LENGTH = 16
+
+
+def tiny_model():
+    # the layout of the trained genre models, small enough to build with random weights
+    # with large random weights, so the generated notes actually change from step to step
+    from keras.initializers import RandomNormal
+    from keras.layers import BatchNormalization, Dense, Dropout, Input, LSTM
+    from keras.models import Sequential
+
+    keras.utils.set_random_seed(0)
+    weights = RandomNormal(stddev=2.0)
+    return Sequential([
+        Input(shape=(SEQUENCE_LENGTH, 1)),
+        LSTM(16, return_sequences=True, kernel_initializer=weights, recurrent_initializer=weights),
+        LSTM(16, kernel_initializer=weights, recurrent_initializer=weights),
+        BatchNormalization(),
+        Dropout(0.3),
+        Dense(NUM_UNIQUE_NOTES, activation='softmax', kernel_initializer=weights),
+    ])
+
+
+def test_incremental_parity():
+    seed = np.random.default_rng(0).integers(0, NUM_UNIQUE_NOTES, SEQUENCE_LENGTH)
+    result = check_incremental_parity(tiny_model(), seed, NUM_UNIQUE_NOTES, num_generate=12)
+    assert result['matches_full_context']
+    assert result['first_note_matches_window']
+    assert result['reprimed_matches_window']
@@ -0,0 +1,23 @@
+import random
+
+import pytest
+
+from reinforcement.genetic_algorithm import KEYS, SCALES, fitness_automated
+from reinforcement.genome import random_population
+from reinforcement.utils import BITS_PER_NOTE
+from reinforcement.vectorized import fitness_population
+
+BARS = 4
+NUM_NOTES = 4
+
+
+@pytest.mark.parametrize('root', [-3, -1, 0, 4, 9])
+@pytest.mark.parametrize('num_steps', [1, 3])
+@pytest.mark.parametrize('pauses', [True, False])
+def test_fitness_population_matches_fitness_automated(root, num_steps, pauses):
+    rng = random.Random(f'{root}-{num_steps}-{pauses}')
+    for key in KEYS:
+        scale = rng.choice(SCALES)
+        population = random_population(16, BARS * NUM_NOTES * BITS_PER_NOTE, rng)
+        args = (BARS, NUM_NOTES, num_steps, pauses, key, scale, root)
+        assert fitness_population(population, *args) == [fitness_automated(genome, *args) for genome in population]
@@ -85,6 +85,7 @@ export const GenerateMusicIdeaButton: FC = () => {
   const [rating, setRating] = useState(0);
   const [generatedClicked, setGeneratedClicked] = useState(false);
   const [midiFiles, setMidiFiles] = useState<string[]>([]);
+  const [jobId, setJobId] = useState("");
   const [generationIndex, setGenerationIndex] = useState(0);
   const [genomeIndex, setGenomeIndex] = useState(0);
   const [startRatingClicked, setStartRatingClicked] = useState(false);
@@ -104,7 +105,7 @@ export const GenerateMusicIdeaButton: FC = () => {
     setStartRatingClicked(true);
     e.preventDefault();
 
-    const fetchUrl = `http://127.0.0.1:5000/get_best_genome?generation_index=${generationIndex}`;
+    const fetchUrl = `http://127.0.0.1:5000/get_best_genome?job_id=${jobId}&generation_index=${generationIndex}`;
 
     try {
       const response = await fetch(fetchUrl);
@@ -130,7 +131,7 @@ export const GenerateMusicIdeaButton: FC = () => {
     setStartRatingClicked(true);
     e.preventDefault()
     if(fitnessChoice === 'Rating'){
-      const response = await fetch(`http://127.0.0.1:5000/get_genome?scale=${scale}&key=${key}&genome_index=0&generation_index=0`);
+      const response = await fetch(`http://127.0.0.1:5000/get_genome?job_id=${jobId}&scale=${scale}&key=${key}&genome_index=0&generation_index=0`);
       if (!response.ok) {
         throw new Error('Failed to fetch MIDI file');
       }
@@ -146,7 +147,7 @@ export const GenerateMusicIdeaButton: FC = () => {
     }
     else
     {
-      const response = await fetch(`http://127.0.0.1:5000/get_best_genome?generation_index=0`);
+      const response = await fetch(`http://127.0.0.1:5000/get_best_genome?job_id=${jobId}&generation_index=0`);
       if (!response.ok) {
         throw new Error('Failed to fetch MIDI file');
       }
@@ -195,6 +196,7 @@ export const GenerateMusicIdeaButton: FC = () => {
         }
         const midiFiles = await generateMelodyResponse.json();
         setMidiFiles(midiFiles);
+        setJobId(midiFiles.job_id);
 
       } catch (error) {
         console.error(error);
@@ -206,7 +208,7 @@ export const GenerateMusicIdeaButton: FC = () => {
       e.preventDefault();
       console.log('Button clicked');
       try {
-        const response = await fetch(`http://127.0.0.1:5000/get_genome?scale=${scale}&key=${key}&genome_index=${genomeIndex}&generation_index=${generationIndex}`);
+        const response = await fetch(`http://127.0.0.1:5000/get_genome?job_id=${jobId}&scale=${scale}&key=${key}&genome_index=${genomeIndex}&generation_index=${generationIndex}`);
         if (!response.ok) {
           throw new Error('Failed to fetch MIDI file');
         }
@@ -228,6 +230,9 @@ export const GenerateMusicIdeaButton: FC = () => {
               'Content-Type': 'application/json',
             },
             body: JSON.stringify({
+              job_id: jobId,
+              generation_index: generationIndex,
+              genome_index: genomeIndex,
               filename: filename,
               rating: rating,
             }),
@@ -250,7 +255,7 @@ export const GenerateMusicIdeaButton: FC = () => {
       e.preventDefault();
       console.log('Button clicked');
       try {
-        const response = await fetch(`http://127.0.0.1:5000/get_best_genome?generation_index=${generationIndex}`);
+        const response = await fetch(`http://127.0.0.1:5000/get_best_genome?job_id=${jobId}&generation_index=${generationIndex}`);
         if (!response.ok) {
           throw new Error('Failed to fetch MIDI file');
         }